@@ -1,7 +1,6 @@
-import re, argparse, glob
+import re, argparse, glob, multiprocessing, hashlib, json
 from enum import Enum
 from pathlib import Path
-import pyexcel as pe
 
 import logging
 logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.ERROR)
@@ -10,11 +9,16 @@ logging.addLevelName(logging.ERROR, "\033[31m%s\033[0m" % logging.getLevelName(l
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-from lib.spreadsheetReader import getRows
+from lib.spreadsheetReader import sniffTable, getSheetNames, closeWorkbooks
 from lib.mung import checkAndClean
 from lib.constants import ASSIGNMENTS_KEY, ALL_DEFAULT_FILTERS
 from lib.config import loadConfig, saveConfig
 
+# Only the header and the first few rows of each source are read. Everything but
+# the max score of scored google forms (see updateOtherConfig) needs just the
+# first row.
+SNIFF_ROWS = 100
+
 FileType = Enum('FileType', 'ROSTER GRADESCOPE SCORED_GOOGLE_FORM UNSCORED_GOOGLE_FORM CLICKERS OTHER')
 
 DEFAULT_ATTR_DICT = {
@@ -59,11 +63,11 @@ def inferTypeFromFields(fields):
 
     return FileType.OTHER
 
-def updateOtherConfig(allAttrs, sourceConf, rows, fileType, allNames):
+def updateOtherConfig(allAttrs, sourceConf, header, rows, fileType, allNames):
     '''updates sourceConf and allNames in place. Returns True if successful; False if the
     file could not be used (i.e. appeared to contain no grade data)'''
-    fields = rows[0].keys()
-    if len(set(fields)) != len(fields):
+    fields = list(dict.fromkeys(header))
+    if len(fields) != len(header):
         logger.warning("duplicate column!")
 
     (attrConfig, ignoredAttrCols) = guessAttrConfig(fields, allAttrs)
@@ -95,6 +99,7 @@ def updateOtherConfig(allAttrs, sourceConf, rows, fileType, allNames):
             maxPoints = int(score.split('/')[1].strip())
             # filters = ["stripDenominator"]
         else:
+            # Guessed from the sampled rows only
             maxPoints = max([int(x['Score']) for x in rows])
             # filters = []
         name = sourceConf.get("sheetName") or Path(sourceConf['file']).stem
@@ -169,12 +174,13 @@ def guessAttrConfig(potentialAttrFields, allAttrs):
             ignoredAttrCols.append(item)
     return (attrConfig, ignoredAttrCols)
 
-def updateGradescopeConfig(allAttrs, sourceConf, rows, allNames):
-    fields = rows[0].keys()
+def updateGradescopeConfig(allAttrs, sourceConf, header, rows, allNames):
+    fields = list(dict.fromkeys(header))
+    fieldSet = set(fields)
     assignments = []
     attrs = []
     for field in fields:
-        if field + " - Max Points" in fields:
+        if field + " - Max Points" in fieldSet:
             assignments.append(field)
         elif " - Max Points" not in field and " - Lateness" not in field:
             attrs.append(field)
@@ -193,8 +199,13 @@ def updateGradescopeConfig(allAttrs, sourceConf, rows, allNames):
         ASSIGNMENTS_KEY: itemConfig,
     })
 
-def updateConfig(globalConfigObj, sourceConf, rows, allNames):
-    fileType = inferTypeFromFields(list(rows[0].keys()))
+def updateConfig(globalConfigObj, sourceConf, header, rows, allNames):
+    '''Adds sourceConf to the config if it looks usable, given the header and
+    the first rows (OrderedDicts) of the source'''
+    if len(header) == 0:
+        logger.debug("\tEmpty; ignoring")
+        return
+    fileType = inferTypeFromFields(list(dict.fromkeys(header)))
     logger.debug(f"\tInferred type: {fileType.name}")
     if fileType == FileType.ROSTER:
         # It's not a proper csv; more like 2 on top of each other.
@@ -209,9 +220,9 @@ def updateConfig(globalConfigObj, sourceConf, rows, allNames):
             ASSIGNMENTS_KEY: []
         })
     elif fileType == FileType.GRADESCOPE:
-        updateGradescopeConfig(globalConfigObj['studentAttributes'], sourceConf, rows, allNames)
+        updateGradescopeConfig(globalConfigObj['studentAttributes'], sourceConf, header, rows, allNames)
     elif fileType in [FileType.SCORED_GOOGLE_FORM, FileType.UNSCORED_GOOGLE_FORM, FileType.CLICKERS, FileType.OTHER]:
-        usable = updateOtherConfig(globalConfigObj['studentAttributes'], sourceConf, rows, fileType, allNames)
+        usable = updateOtherConfig(globalConfigObj['studentAttributes'], sourceConf, header, rows, fileType, allNames)
         if not usable:
             return
     else:
@@ -219,8 +230,28 @@ def updateConfig(globalConfigObj, sourceConf, rows, allNames):
 
     globalConfigObj["sources"].append(sourceConf)
 
-
-def main(sources, configInFilename, configOutFilename):
+def addNewColumns(globalConfigObj, sourceConf, header, rows, oldHeader, allNames):
+    '''Adds assignments to an already configured source for the columns that
+    were not in oldHeader (e.g. new gradescope assignments or clicker
+    sessions). Everything already in its config is kept as is.'''
+    newColumns = set(header).difference(oldHeader)
+    if len(newColumns) == 0:
+        return
+    # Configure the source from scratch, then keep only the new columns
+    scratchConfigObj = {"studentAttributes": globalConfigObj["studentAttributes"], "sources": []}
+    updateConfig(scratchConfigObj, {"file": sourceConf["file"], "sheetName": sourceConf["sheetName"]}, header, rows, set(allNames))
+    if len(scratchConfigObj["sources"]) == 0:
+        return
+    knownColumns = set(item.get('scoreCol') for item in sourceConf[ASSIGNMENTS_KEY])
+    for item in scratchConfigObj["sources"][0][ASSIGNMENTS_KEY]:
+        scoreCol = item.get('scoreCol')
+        if scoreCol in newColumns and scoreCol not in knownColumns:
+            item['name'] = forceUniqueName(scoreCol, allNames)
+            logger.debug(f"\tAdding new column `{scoreCol}`")
+            sourceConf[ASSIGNMENTS_KEY].append(item)
+
+
+def main(sources, configInFilename, configOutFilename, jobs=1):
     if configInFilename:
         globalConfigObj = loadConfig(configInFilename)
     else:
@@ -238,8 +269,79 @@ def main(sources, configInFilename, configOutFilename):
         }
 
     # ignoredFiles = globalConfigObj.get("_autoconf_ignoredFiles", [])
-    preconfiguredFiles = list(map(getSource, globalConfigObj["sources"]))
-    allNames = set()
+    configuredSources = {getSource(sourceConf): sourceConf for sourceConf in globalConfigObj["sources"]}
+    oldFingerprints = loadFingerprints(configInFilename) if configInFilename else {}
+    fingerprints = dict(oldFingerprints)
+    allNames = set(item['name'] for sourceConf in globalConfigObj["sources"] for item in sourceConf[ASSIGNMENTS_KEY])
+    # Files are sniffed in parallel but added to the config in sorted order, so
+    # that the config (including the names made unique by forceUniqueName)
+    # does not depend on directory listing order or on scheduling
+    filePaths = sorted(findSourceFiles(sources), key=lambda filePath: (str(filePath).lower(), str(filePath)))
+    args = [(filePath, oldFingerprints.get(str(filePath))) for filePath in filePaths]
+    # Workbooks opened while loading the config must not be shared with the
+    # forked workers
+    closeWorkbooks()
+    if jobs <= 1:
+        sniffed = map(sniffFile, args)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs)
+        sniffed = pool.imap(sniffFile, args)
+    try:
+        for ((filePath, oldFingerprint), (fingerprint, sourceList)) in zip(args, sniffed):
+            fingerprints[str(filePath)] = fingerprint
+            if sourceList == None:
+                logger.debug(f"Skipping `{filePath}` because it has not changed")
+                continue
+            for (sheetName, header, rows) in sourceList:
+                sourceDesc = f"`{filePath}`{' (sheet '+sheetName+')' if sheetName else ''}"
+                sourceConf = configuredSources.get((str(filePath), sheetName))
+                if sourceConf == None:
+                    logger.debug(f"Handling source {sourceDesc}")
+                    sourceConf = {"file": str(filePath), "sheetName": sheetName}
+                    updateConfig(globalConfigObj, sourceConf, header, rows, allNames)
+                elif oldFingerprint != None and sheetKey(sheetName) in oldFingerprint["headers"]:
+                    logger.debug(f"Checking changed source {sourceDesc} for new columns")
+                    addNewColumns(globalConfigObj, sourceConf, header, rows, oldFingerprint["headers"][sheetKey(sheetName)], allNames)
+                else:
+                    # Configured before fingerprints were recorded, so there is
+                    # no telling which columns are new
+                    logger.debug(f"Skipping {sourceDesc} because it is already configured")
+    finally:
+        if pool != None:
+            pool.close()
+            pool.join()
+    globalConfigObj["sources"].sort(key=mySort)
+
+    categories = set()
+    for sourceData in globalConfigObj['sources']:
+        for item in sourceData[ASSIGNMENTS_KEY]:
+            categories.add(item['type'])
+    oldCategories = set(map(lambda z: z['from'], globalConfigObj['outputs']['content']))
+    globalConfigObj['outputs']['content'] += [{ "title": f"[Rename me - display name of {c}]", "from": c} for c in sorted(categories.difference(oldCategories))]
+
+    saveConfig(configOutFilename, globalConfigObj)
+    saveFingerprints(configOutFilename, fingerprints)
+    logger.info(f"Wrote config file to `{configOutFilename}`")
+
+def fingerprintsPath(configFilename):
+    '''The fingerprints of a config's files are kept next to it (CONFIG.json
+    -> CONFIG.autoconf.json), out of the way of hand edits to the config'''
+    configPath = Path(configFilename)
+    return configPath.with_name(f'{configPath.stem}.autoconf.json')
+
+def loadFingerprints(configFilename):
+    try:
+        return json.loads(fingerprintsPath(configFilename).read_text())
+    except FileNotFoundError:
+        return {}
+
+def saveFingerprints(configFilename, fingerprints):
+    fingerprintsPath(configFilename).write_text(json.dumps(fingerprints, indent=2, sort_keys=True))
+
+def findSourceFiles(sources):
+    '''Yields the csv and xlsx files given directly in `sources` or found
+    (recursively) in its directories'''
     for inFile in sources:
         inFilePath = Path(inFile)
         if inFilePath.is_dir():
@@ -247,8 +349,7 @@ def main(sources, configInFilename, configOutFilename):
             fileIter = glob.iglob(str(inFilePath/'**'), recursive=True)
         else:
             fileIter = [inFile]
-        fileIter = [Path(filename) for filename in fileIter]
-        for filePath in fileIter:
+        for filePath in map(Path, fileIter):
             if filePath.name[:2] == "~$":
                 logger.debug(f"Ignoring xlsx temporary file: `{filePath}`.")
                 continue
@@ -257,38 +358,40 @@ def main(sources, configInFilename, configOutFilename):
             # if filename in ignoredFiles:
             #     print("Skipping because of _autoconf_ignoredFiles")
             #     continue
-
-            ext = filePath.suffix
-            if ext == ".csv":
-                sourceIter = [(filePath, None)]
-            elif ext == ".xlsx":
-                book = pe.get_book(file_name=str(filePath))
-                sourceIter = [(filePath, name) for name in book.sheet_names()]
-            else:
+            if filePath.suffix not in (".csv", ".xlsx"):
                 logger.debug(f"Ignoring non-csv/xlsx file: `{filePath}`.")
                 continue
-
-            for (filePath, sheetName) in sourceIter:
-                logger.debug(f"Handling source `{filePath}`{' (sheet '+sheetName+')' if sheetName else ''}")
-
-                if (str(filePath), sheetName) in preconfiguredFiles:
-                    logger.debug("Skipping because file is already configured")
-                    continue
-                rows = getRows(filePath, sheetName=sheetName)
-                sourceConf = {"file": str(filePath), "sheetName": sheetName}
-                updateConfig(globalConfigObj, sourceConf, rows, allNames)
-
-    globalConfigObj["sources"].sort(key=mySort)
-
-    categories = set()
-    for sourceData in globalConfigObj['sources']:
-        for item in sourceData[ASSIGNMENTS_KEY]:
-            categories.add(item['type'])
-    oldCategories = set(map(lambda z: z['from'], globalConfigObj['outputs']['content']))
-    globalConfigObj['outputs']['content'] += [{ "title": f"[Rename me - display name of {c}]", "from": c} for c in categories.difference(oldCategories)]
-
-    saveConfig(configOutFilename, globalConfigObj)
-    logger.info(f"Wrote config file to `{configOutFilename}`")
+            yield filePath
+
+def sniffFile(args):
+    '''Fingerprints the file (its sha256, and the header of each source in it:
+    the file, or each sheet of an xlsx). If the file has changed since
+    oldFingerprint (or is new), also reads the header and first SNIFF_ROWS
+    rows of each source.
+    Returns (fingerprint, [(sheetName, header, rows)]), or (fingerprint, None)
+    if the file has not changed.'''
+    (filePath, oldFingerprint) = args
+    digest = hashlib.sha256(filePath.read_bytes()).hexdigest()
+    if oldFingerprint != None and oldFingerprint["sha256"] == digest:
+        return (oldFingerprint, None)
+    try:
+        if filePath.suffix == ".xlsx":
+            sheetNames = getSheetNames(filePath)
+        else:
+            sheetNames = [None]
+        sourceList = []
+        headers = {}
+        for sheetName in sheetNames:
+            (header, rows) = sniffTable(filePath, sheetName=sheetName, sampleSize=SNIFF_ROWS)
+            sourceList.append((sheetName, header, rows))
+            headers[sheetKey(sheetName)] = header
+        return ({"sha256": digest, "headers": headers}, sourceList)
+    finally:
+        closeWorkbooks()
+
+def sheetKey(sheetName):
+    '''Fingerprints key the headers of csv files (which have no sheets) by ""'''
+    return "" if sheetName == None else sheetName
 
 def getSource(sourceObj):
     return (sourceObj["file"], sourceObj.get("sheetName", None))
@@ -302,5 +405,6 @@ if __name__ == "__main__":
         help='A csv or xlsx source (roster, gradesheet, etc) or a directory containing such sources')
     parser.add_argument('-i', metavar='CONFIG_FILE', type=str, help='An initial config file to add to')
     parser.add_argument('-o', metavar='OUTPUT_FILE', type=str, help='Output file (default: tempConfig.json)', default='tempConfig.json')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes used to read sources (default: 1)')
     args = parser.parse_args()
-    main(args.sourcesDir, args.i, args.o)
+    main(args.sourcesDir, args.i, args.o, args.jobs)
@@ -0,0 +1,119 @@
+import argparse, concurrent.futures, multiprocessing, collections, os, sys, time
+from pathlib import Path
+
+import main
+from lib.spreadsheetReader import closeWorkbooks
+from lib.config import loadConfig
+from lib.sourceCache import SourceCache
+
+def readAllSources(courses, jobs=1, cache=None):
+    '''Reads each distinct source of all the courses once (courses often share
+    roster exports), using a pool of `jobs` worker processes. Returns a dict
+    from sourceKey to the source's (Student, [Grade]) pairs.'''
+    work = {}
+    for globalConfigObj in courses.values():
+        studentAttrDict = globalConfigObj["studentAttributes"]
+        for obj in globalConfigObj["sources"]:
+            key = main.sourceKey(obj, studentAttrDict)
+            if key not in work:
+                cacheKey = cache.keyFor(obj, studentAttrDict) if cache != None else None
+                work[key] = (obj, studentAttrDict, cache, cacheKey)
+    # Workbooks opened while loading the configs must not be shared with the
+    # forked workers
+    closeWorkbooks()
+    if jobs <= 1:
+        # Sources that are sheets of the same workbook reuse the open workbook
+        data = [main.readSource(args) for args in work.values()]
+        closeWorkbooks()
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            data = pool.map(main.readSource, work.values())
+    if cache != None:
+        cache.finish()
+    return dict(zip(work.keys(), data))
+
+def runCourses(courses, outputRoot, args):
+    '''Merges and writes the reports of each course (a dict from config path
+    to config) into outputRoot/<config name>, reading shared sources only
+    once. The pdfs of all courses are generated by one pool of threads, and
+    are only waited for once every course's html reports are written.
+    Returns (readSeconds, distinctSourceCount, timings, pdfSeconds,
+    pdfFailureCount): timings has a (configPath, sourceCount, studentCount,
+    mergeSeconds, reportSeconds) entry for each course, and pdfSeconds (None
+    without --pdf) is the time spent waiting for the pdfs after the last
+    course.'''
+    start = time.perf_counter()
+    sourceData = readAllSources(courses, args.jobs, SourceCache(args.cache_dir) if args.cache_dir else None)
+    readSeconds = time.perf_counter() - start
+    # Each source's data is released once the last course using it is done
+    usesLeft = collections.Counter(main.sourceKey(obj, globalConfigObj["studentAttributes"])
+        for globalConfigObj in courses.values() for obj in globalConfigObj["sources"])
+    pdfExecutor = None
+    if args.pdf and args.pdf_backend == 'wkhtmltopdf':
+        # One pool of wkhtmltopdf threads for all courses
+        pdfExecutor = concurrent.futures.ThreadPoolExecutor(args.pdf_jobs or os.cpu_count())
+    timings = []
+    reportRuns = []
+    try:
+        for (configPath, globalConfigObj) in courses.items():
+            print(f"Course {configPath}", file=sys.stderr)
+            keys = [main.sourceKey(obj, globalConfigObj["studentAttributes"]) for obj in globalConfigObj["sources"]]
+            start = time.perf_counter()
+            (gradebook, _) = main.mergeSources(globalConfigObj, (pair for key in keys for pair in sourceData[key]))
+            merged = time.perf_counter()
+            reportRuns.append(main.generateReports(globalConfigObj, gradebook, args, reportsDir=outputRoot / Path(configPath).stem, pdfExecutor=pdfExecutor))
+            timings.append((configPath, len(set(keys)), len(gradebook), merged - start, time.perf_counter() - merged))
+            for key in keys:
+                usesLeft[key] -= 1
+                if usesLeft[key] == 0:
+                    del sourceData[key]
+        start = time.perf_counter()
+        pdfFailures = 0
+        for reportRun in reportRuns:
+            pdfFailures += len(reportRun.finish())
+        pdfSeconds = time.perf_counter() - start if args.pdf else None
+    finally:
+        if pdfExecutor != None:
+            pdfExecutor.shutdown()
+    return (readSeconds, len(usesLeft), timings, pdfSeconds, pdfFailures)
+
+def printTimings(readSeconds, sourceCount, timings, pdfSeconds):
+    print(f"\nRead {sourceCount} distinct sources in {readSeconds:.2f}s", file=sys.stderr)
+    width = max([len('Course')] + [len(str(configPath)) for (configPath, *_) in timings])
+    print(f"{'Course':<{width}}  {'Sources':>7}  {'Students':>8}  {'Merge':>7}  {'Reports':>7}  {'Total':>7}", file=sys.stderr)
+    for (configPath, sources, students, mergeSeconds, reportSeconds) in timings:
+        print(f"{str(configPath):<{width}}  {sources:>7}  {students:>8}  {mergeSeconds:>6.2f}s  {reportSeconds:>6.2f}s  {mergeSeconds + reportSeconds:>6.2f}s", file=sys.stderr)
+    if pdfSeconds != None:
+        print(f"Waited {pdfSeconds:.2f}s for the remaining pdfs of all courses", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate the reports of several courses in one run.')
+    parser.add_argument('filenames', metavar='CONFIG_FILE', type=str, nargs='+',
+        help='The .json file describing each course. Reports go to OUTPUT_ROOT/<name of the file without .json>.')
+    parser.add_argument('-o', '--output-root', default='reports', metavar='OUTPUT_ROOT', help='Directory holding the reports directory of each course (default: reports)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes used to read the sources of all courses (default: 1)')
+    parser.add_argument('--cache-dir', help='Directory in which to cache the data read from each source (see main.py)')
+    parser.add_argument('-p', '--pdf', action='store_true', help='Generate pdf reports')
+    parser.add_argument('-w', '--wkhtmltopdf-path', help='Path to wkhtmltopdf executable')
+    parser.add_argument('--pdf-backend', choices=['wkhtmltopdf', 'native'], default='wkhtmltopdf',
+        help='Convert the html reports with wkhtmltopdf (default), or draw the pdfs directly without it (native)')
+    parser.add_argument('--pdf-jobs', type=int, help='Number of pdfs to generate at once, over all courses (default: number of cpus)')
+    parser.add_argument('--pdf-batch', type=int, metavar='N', help='Convert the reports of N students with each wkhtmltopdf process (see main.py)')
+    parser.add_argument('--pdf-split', action='store_true', help='With --pdf-batch, split the combined pdfs into one pdf per student')
+    args = parser.parse_args()
+    for (given, option) in [(args.pdf_backend == 'native', '--pdf-backend native'), (args.pdf_batch, '--pdf-batch'), (args.pdf_split, '--pdf-split')]:
+        if given and not args.pdf:
+            parser.error(f"{option} only applies with --pdf")
+    if args.pdf_split and not args.pdf_batch:
+        parser.error("--pdf-split only applies with --pdf-batch")
+    if args.pdf_backend == 'native' and args.pdf_batch:
+        parser.error("--pdf-batch only applies to the wkhtmltopdf backend")
+    stems = collections.Counter(Path(filename).stem for filename in args.filenames)
+    clashes = sorted(stem for (stem, count) in stems.items() if count > 1)
+    if len(clashes) > 0:
+        parser.error(f"several config files are named {', '.join(clashes)}, so their reports would share a directory")
+    courses = {filename: loadConfig(filename) for filename in args.filenames}
+    (readSeconds, sourceCount, timings, pdfSeconds, pdfFailures) = runCourses(courses, Path(args.output_root), args)
+    printTimings(readSeconds, sourceCount, timings, pdfSeconds)
+    if pdfFailures > 0:
+        exit(1)
@@ -0,0 +1,103 @@
+# Times each stage of main.py (and autoconf.py) on a synthetic course, and
+# appends the timings to COURSE_DIR/bench-results.jsonl so that they can be
+# compared between versions of the code. The course is generated first (see
+# bench/generate.py) if COURSE_DIR does not contain one yet.
+#
+# Usage (from the repository root):
+#   python3 -m bench.benchmark COURSE_DIR --students 2000 --sources 50 --assignments 500
+
+import argparse, contextlib, datetime, json, logging, os, subprocess, time
+from pathlib import Path
+
+import main
+import autoconf
+from lib.config import loadConfig
+from lib.printing import makeCsvSummary, compileLayout, printReport
+from bench.generate import generateCourse
+
+RESULTS_FILE = 'bench-results.jsonl'
+
+class Timer:
+    '''Collects the wall time of named stages, in order'''
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        yield
+        self.stages[name] = time.perf_counter() - start
+
+def runStages(configPath, jobs=1):
+    '''Runs the main.py pipeline on the config (writing reports to ./reports)
+    and returns the wall time of each stage in seconds'''
+    timer = Timer()
+    with timer.stage('loadConfig'):
+        globalConfigObj = loadConfig(configPath)
+    with timer.stage('gatherData'):
+        (gradebook, allAssignments) = main.gatherData(globalConfigObj, jobs)
+    with timer.stage('postprocess'):
+        main.postprocess(globalConfigObj['processing'], gradebook)
+    with timer.stage('makeCsvSummary'):
+        makeCsvSummary(list(globalConfigObj["studentAttributes"].keys()), gradebook, globalConfigObj["outputs"])
+    with timer.stage('reports'):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            layout = compileLayout(globalConfigObj["outputs"], gradebook)
+            for row in range(len(gradebook)):
+                printReport(gradebook, row, layout, globalConfigObj["outputs"])
+    with timer.stage('autoconf'):
+        autoconf.main([str(Path(configPath).parent / 'data')], None, 'bench-autoconf.json')
+    return timer.stages
+
+def gitRevision():
+    try:
+        res = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, cwd=Path(__file__).parent)
+        return res.stdout.decode('utf-8').strip() or None
+    except OSError:
+        return None
+
+def printComparison(stages, previous):
+    print(f"{'stage':<16}{'seconds':>10}{'previous':>10}{'change':>9}")
+    for (name, seconds) in stages.items():
+        old = previous['stages'].get(name) if previous else None
+        if old:
+            print(f"{name:<16}{seconds:>10.3f}{old:>10.3f}{(seconds - old) / old:>+9.0%}")
+        else:
+            print(f"{name:<16}{seconds:>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('courseDir', metavar='COURSE_DIR', type=str, help='Directory holding (or to generate) the synthetic course')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--sources', type=int, default=50)
+    parser.add_argument('--assignments', type=int, default=500)
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Passed on to gatherData')
+    parser.add_argument('--label', help='Free-form note stored with the results')
+    args = parser.parse_args()
+
+    courseDir = Path(args.courseDir).resolve()
+    configPath = courseDir / 'config.json'
+    if not configPath.exists():
+        print(f"Generating course in `{courseDir}`...")
+        generateCourse(courseDir, args.students, args.sources, args.assignments)
+
+    # Warnings about the (deliberately messy) synthetic data would swamp the output
+    logging.disable(logging.CRITICAL)
+    os.chdir(courseDir)
+    stages = runStages(configPath, args.jobs)
+
+    resultsPath = courseDir / RESULTS_FILE
+    previous = None
+    if resultsPath.exists():
+        lines = resultsPath.read_text().splitlines()
+        previous = json.loads(lines[-1]) if lines else None
+    printComparison(stages, previous)
+    result = {
+        "time": datetime.datetime.now().isoformat(timespec='seconds'),
+        "revision": gitRevision(),
+        "label": args.label,
+        "jobs": args.jobs,
+        "stages": stages
+    }
+    with open(resultsPath, 'a') as f:
+        f.write(json.dumps(result) + '\n')
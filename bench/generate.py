@@ -0,0 +1,194 @@
+# Writes a synthetic course (roster, gradescope export, scored google forms,
+# clicker registrations, clicker sessions and multi-sheet xlsx attendance
+# workbooks) together with a matching config file, at any scale, so that the
+# performance of main.py and autoconf.py can be measured on large classes.
+#
+# Usage (from the repository root):
+#   python3 -m bench.generate OUTPUT_DIR --students 2000 --sources 50 --assignments 500
+
+import argparse, csv, datetime, random
+from pathlib import Path
+import openpyxl
+
+from lib.config import saveConfig
+from lib.constants import ASSIGNMENTS_KEY, ALL_DEFAULT_FILTERS
+
+__all__ = ['generateCourse']
+
+SOURCE_KINDS = ['gradescope', 'form', 'clickers', 'attendance']
+STUDENT_ATTRIBUTES = {
+    "Roster Name": {"onePerStudent": True, "onlyPrintIfPresent": True},
+    "Email": {},
+    "Student ID": {"identifiesStudent": True, "onePerStudent": True, "filters": ["strip", "toUpper", "ucsdIDCheck"]},
+    "Clicker ID": {"identifiesStudent": True, "filters": ["strip", "remove#", "8char", "toUpper"]}
+}
+TERM_START = datetime.datetime(2018, 9, 27)
+
+def generateCourse(outDir, students=2000, sources=50, assignments=500, seed=0):
+    '''Writes the data files to `outDir`/data and the config to
+    `outDir`/config.json (with absolute paths to the data files).
+    `sources` is the number of files, counting the roster and clicker
+    registration form. Each google form holds one assignment; the other
+    assignments are spread evenly over the remaining files.
+    Returns the path of the config file.'''
+    rng = random.Random(seed)
+    outDir = Path(outDir).resolve()
+    dataDir = outDir / 'data'
+    dataDir.mkdir(parents=True, exist_ok=True)
+    people = [mkStudent(rng, i) for i in range(students)]
+
+    sourceConfigs = [writeRoster(dataDir, people), writeClickerRegistrations(rng, dataDir, people)]
+    kinds = [SOURCE_KINDS[i % len(SOURCE_KINDS)] for i in range(max(sources - len(sourceConfigs), 1))]
+    formIdxs = [i for (i, kind) in enumerate(kinds) if kind == 'form'][:assignments]
+    otherIdxs = [i for (i, kind) in enumerate(kinds) if kind != 'form']
+    otherAssignments = assignments - len(formIdxs)
+    counts = {i: 1 for i in formIdxs}
+    for (j, i) in enumerate(otherIdxs):
+        counts[i] = otherAssignments // len(otherIdxs) + (1 if j < otherAssignments % len(otherIdxs) else 0)
+    for (i, kind) in enumerate(kinds):
+        count = counts.get(i, 0)
+        if count == 0:
+            continue
+        if kind == 'form':
+            sourceConfigs.append(writeForm(rng, dataDir, people, i))
+        elif kind == 'gradescope':
+            sourceConfigs.append(writeGradescope(rng, dataDir, people, i, count))
+        elif kind == 'clickers':
+            sourceConfigs.append(writeClickers(rng, dataDir, people, i, count))
+        else:
+            sourceConfigs += writeAttendance(rng, dataDir, people, i, count)
+
+    categories = sorted(set(a['type'] for s in sourceConfigs for a in s[ASSIGNMENTS_KEY]))
+    configObj = {
+        "studentAttributes": STUDENT_ATTRIBUTES,
+        "sources": sourceConfigs,
+        "processing": [{"action": "dropLowest", "type": "homework"}],
+        "outputs": {
+            "report-name": "Synthetic Course Grade Report",
+            "disclaimer-text": "These are all the scores recorded for you in this course.",
+            "content": [{"title": c, "from": c} for c in categories]
+        }
+    }
+    configPath = outDir / 'config.json'
+    saveConfig(configPath, configObj)
+    return configPath
+
+def mkStudent(rng, i):
+    return {
+        "pid": f"A{10000000 + i:08d}",
+        "name": f"Last{i}, First{i}",
+        "email": f"student{i}@ucsd.edu",
+        "clicker": f"{rng.getrandbits(32):08X}"
+    }
+
+def mkSource(path, attributes, assignments, sheetName=None, isRoster=False):
+    sourceObj = {"file": str(path), "sheetName": sheetName, "attributes": attributes, ASSIGNMENTS_KEY: assignments}
+    if isRoster:
+        sourceObj["isRoster"] = True
+    return sourceObj
+
+def mkAssignment(name, scoreCol, maxPoints, itemType, **extra):
+    assignment = {"name": name, "max_points": maxPoints, "type": itemType, "filters": ALL_DEFAULT_FILTERS}
+    if scoreCol != None:
+        assignment["scoreCol"] = scoreCol
+    assignment.update(extra)
+    return assignment
+
+def writeCsv(path, rows):
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+def writeRoster(dataDir, people):
+    path = dataDir / 'Roster.csv'
+    rows = [
+        ['Sect ID', 'Course', 'Title', 'SecCode', 'Instructor', '', '', ''],
+        ['111115', 'CSE999', 'Synthetic Course', 'A01', 'Instructor, An'] + [''] * 3,
+        [''] * 8,
+        ['Sec ID', 'PID', 'Student', 'Credits', 'College', 'Major', 'Level', 'Email']
+    ]
+    rows += [['111115', p['pid'], p['name'], '4', 'RE', 'CS26', 'JR', p['email']] for p in people]
+    writeCsv(path, rows)
+    return mkSource(path, {"Email": "Email", "PID": "Student ID", "Student": "Roster Name"}, [], isRoster=True)
+
+def writeClickerRegistrations(rng, dataDir, people):
+    path = dataDir / 'clickerRegistrations.csv'
+    rows = [['Timestamp', 'Email Address', 'Your PID', 'Your iclicker ID']]
+    for p in people:
+        # A few students mistype their clicker ID
+        clicker = p['clicker'] if rng.random() > 0.01 else p['clicker'][:6]
+        rows.append([formatTimestamp(TERM_START), p['email'], p['pid'], '#' + clicker])
+    writeCsv(path, rows)
+    return mkSource(path, {"Your PID": "Student ID", "Your iclicker ID": "Clicker ID"}, [])
+
+def writeGradescope(rng, dataDir, people, idx, count):
+    path = dataDir / f'gradescope{idx}.csv'
+    names = [f'HW {idx}.{j}' for j in range(count)]
+    header = ['Name', 'SID', 'Email', 'Section']
+    for name in names:
+        header += [name, f'{name} - Max Points', f'{name} - Lateness (H:M:S)']
+    rows = [header]
+    for p in people:
+        row = [p['name'], p['pid'], p['email'], '']
+        for _ in names:
+            score = '' if rng.random() < 0.05 else str(rng.randint(0, 20))
+            row += [score, '20', '00:00:00']
+        rows.append(row)
+    writeCsv(path, rows)
+    return mkSource(path, {"SID": "Student ID"}, [mkAssignment(name, name, 20, "homework") for name in names])
+
+def writeForm(rng, dataDir, people, idx):
+    '''A scored google form, with some late submissions'''
+    path = dataDir / f'quiz{idx}.csv'
+    dueDate = TERM_START + datetime.timedelta(days=idx)
+    rows = [['Timestamp', 'Email Address', 'Score', 'PID']]
+    for p in people:
+        if rng.random() < 0.1:
+            continue
+        submitted = dueDate - datetime.timedelta(hours=rng.uniform(-2, 72))
+        rows.append([formatTimestamp(submitted), p['email'], f'{rng.randint(0, 3)} / 3', p['pid']])
+    writeCsv(path, rows)
+    assignment = mkAssignment(f'Quiz {idx}', 'Score', 3, "quiz", due_date=formatTimestamp(dueDate), timestampCol="Timestamp")
+    return mkSource(path, {"PID": "Student ID"}, [assignment])
+
+def writeClickers(rng, dataDir, people, idx, count):
+    path = dataDir / f'clickers{idx}.csv'
+    sessions = [f'Session {j + 1} Participation {idx}' for j in range(count)]
+    rows = [['Last Name', 'First Name', 'Student ID', 'Remote ID'] + sessions]
+    for p in people:
+        clicker = '#' + p['clicker']
+        rows.append([clicker] * 4 + [rng.choice(['1', '1', '1', 'NV', '0']) for _ in sessions])
+    writeCsv(path, rows)
+    assignments = [mkAssignment(f'Clickers {idx}.{j + 1}', session, 1, "clickers") for (j, session) in enumerate(sessions)]
+    return mkSource(path, {"Remote ID": "Clicker ID"}, assignments)
+
+def writeAttendance(rng, dataDir, people, idx, count):
+    '''One xlsx workbook with a sheet per section, each holding all weeks'''
+    path = dataDir / f'attendance{idx}.xlsx'
+    wb = openpyxl.Workbook(write_only=True)
+    weeks = [f'Week {j + 1}' for j in range(count)]
+    sheetCount = 4
+    sourceConfigs = []
+    for s in range(sheetCount):
+        sheetName = f'Section {s + 1}'
+        ws = wb.create_sheet(sheetName)
+        ws.append(['PID', 'Student Name'] + weeks)
+        for p in people[s::sheetCount]:
+            ws.append([p['pid'], p['name']] + [rng.choice([1, 1, 1, None]) for _ in weeks])
+        assignments = [mkAssignment(f'Attendance {idx}.{j + 1}', week, 1, "discussion") for (j, week) in enumerate(weeks)]
+        sourceConfigs.append(mkSource(path, {"PID": "Student ID"}, assignments, sheetName=sheetName))
+    wb.save(str(path))
+    return sourceConfigs
+
+def formatTimestamp(t):
+    return t.strftime('%m/%d/%Y %H:%M:%S')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('outDir', metavar='OUTPUT_DIR', type=str, help='Directory to write the course to')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--sources', type=int, default=50, help='Number of source files (default: 50)')
+    parser.add_argument('--assignments', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    configPath = generateCourse(args.outDir, args.students, args.sources, args.assignments, args.seed)
+    print(f"Wrote config file to `{configPath}`")
@@ -2,11 +2,13 @@
 # read and write. Accordingly, the files should always be written and read
 # using this module, which desugars on read and resugars on write
 
-import json, copy, itertools
+import json, copy, itertools, logging
 from pathlib import Path
-import pyexcel as pe
 
 from lib.constants import ASSIGNMENTS_KEY, ALL_DEFAULT_FILTERS
+from lib.spreadsheetReader import getSheetNames
+
+logger = logging.getLogger(__name__)
 
 def loadConfig(filename):
     configObj = json.loads(Path(filename).read_text())
@@ -43,8 +45,7 @@ def loadConfig(filename):
             # there are no assignments)
             # Duplicate source once for each sheet in document.
             if all('sheetName' not in item for item in assignments):
-                book = pe.get_book(file_name=sourceObj['file'])
-                for sheetName in book.sheet_names():
+                for sheetName in getSheetNames(Path(sourceObj['file'])):
                     newSource = copy.deepcopy(sourceObj)
                     newSource['sheetName'] = sheetName
                     newSources.append(newSource)
@@ -53,7 +54,8 @@ def loadConfig(filename):
             # Duplicate source once for each named sheet and partition
             # assignments by sheet name
             elif all('sheetName' in item for item in assignments):
-                usedSheets = [item['sheetName'] for item in assignments]
+                # Each sheet once, in order of first use
+                usedSheets = list(dict.fromkeys(item['sheetName'] for item in assignments))
                 for sheetName in usedSheets:
                     newSource = copy.deepcopy(sourceObj)
                     newSource['sheetName'] = sheetName
@@ -75,6 +77,14 @@ def loadConfig(filename):
     return configObj
 
 
+def findPrimaryAttr(attrDict):
+    '''Returns the attribute whose values are the students' primary
+    identifiers (the first that identifies students, one per student)'''
+    for (attr, flags) in attrDict.items():
+        if flags["identifiesStudent"] and flags["onePerStudent"]:
+            return attr
+    logger.error("no primary student identifier")
+
 def saveConfig(filename, configObj):
     '''shouldn't modify configObj but TODO probably does'''
     newConfig = copy.deepcopy(configObj)
@@ -0,0 +1,183 @@
+import sqlite3, json, hashlib, datetime
+
+import numpy as np
+
+from lib.config import findPrimaryAttr
+
+__all__ = ['GradeStore']
+
+# Grades are keyed by integer student and assignment ids, which makes saving a
+# large class several times faster than text keys; named_grades shows them by
+# name for ad-hoc queries
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    saved TEXT NOT NULL,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    identifier TEXT NOT NULL UNIQUE,
+    signature TEXT NOT NULL,
+    last_run INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS students_by_run ON students (last_run);
+CREATE TABLE IF NOT EXISTS attributes (
+    student INTEGER NOT NULL,
+    attr TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (student, attr, value)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attributes_by_value ON attributes (attr, value);
+CREATE TABLE IF NOT EXISTS identifiers (
+    attr TEXT NOT NULL,
+    value TEXT NOT NULL,
+    student INTEGER NOT NULL,
+    PRIMARY KEY (attr, value)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS identifiers_by_student ON identifiers (student);
+CREATE TABLE IF NOT EXISTS assignments (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    max_points REAL,
+    config TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS grades (
+    student INTEGER NOT NULL,
+    assignment INTEGER NOT NULL,
+    score REAL,
+    str_score TEXT,
+    annotations TEXT,
+    dropped INTEGER NOT NULL,
+    PRIMARY KEY (student, assignment)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS grades_by_assignment ON grades (assignment);
+CREATE VIEW IF NOT EXISTS named_grades AS
+    SELECT students.identifier AS student, assignments.name AS assignment,
+        COALESCE(grades.str_score, grades.score) AS score, grades.annotations, grades.dropped
+    FROM grades
+    JOIN students ON students.id = grades.student
+    JOIN assignments ON assignments.id = grades.assignment;
+'''
+
+class GradeStore:
+    '''A SQLite file holding the merged students, their identifiers (as in the
+    roster: each identifying (attr, value) maps to one student), assignments
+    and grades, so that they can be queried after the run (see query.py, or
+    use the sqlite3 shell).
+
+    Each save upserts: students whose grades and attributes are unchanged
+    since they were last saved are only marked as seen by this run, the other
+    students' rows are replaced, and students missing from this run keep
+    their grades and attributes (students.last_run tells which run last saw
+    them) but lose their identifiers, which may since belong to others.'''
+    def __init__(self, path):
+        self.connection = sqlite3.connect(str(path))
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def save(self, gradebook, studentAttrDict, configPath=None):
+        '''Upserts the (postprocessed) gradebook. Returns the number of
+        students whose rows were rewritten.'''
+        identifying = [attr for (attr, flags) in studentAttrDict.items() if flags['identifiesStudent']]
+        # The gradebook's student IDs are values of the primary attribute
+        primaryAttr = findPrimaryAttr(studentAttrDict)
+        # Renamed or reordered assignments change every student's signature
+        layoutHash = hashlib.sha256(json.dumps(gradebook.assignmentNames).encode()).digest()
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO runs (saved, config) VALUES (?, ?)',
+                (datetime.datetime.now().isoformat(timespec='seconds'), str(configPath) if configPath != None else None))
+            runID = cursor.lastrowid
+            assignmentIDs = self.upsertAssignments(gradebook.allAssignments)
+            oldSignatures = dict(self.connection.execute('SELECT identifier, signature FROM students'))
+            changed = []
+            for (row, rowSignature) in enumerate(gradebook.rowSignatures()):
+                info = {k: sorted(v) if type(v) in (set, list) else v for (k, v) in gradebook.info[row].items()}
+                digest = hashlib.sha256(layoutHash + repr((sorted(info.items()), rowSignature)).encode()).hexdigest()
+                if oldSignatures.get(gradebook.studentIDs[row]) != digest:
+                    changed.append((row, digest))
+            # Students keep their id (which the other tables refer to) across saves
+            self.connection.executemany('INSERT OR IGNORE INTO students (identifier, signature, last_run) VALUES (?, ?, ?)',
+                [(studentID, '', runID) for studentID in gradebook.studentIDs])
+            self.connection.executemany('UPDATE students SET last_run = ? WHERE identifier = ?',
+                [(runID, studentID) for studentID in gradebook.studentIDs])
+            self.connection.executemany('UPDATE students SET signature = ? WHERE identifier = ?',
+                [(digest, gradebook.studentIDs[row]) for (row, digest) in changed])
+            studentIDs = dict(self.connection.execute('SELECT identifier, id FROM students'))
+            changed = [(row, studentIDs[gradebook.studentIDs[row]]) for (row, _) in changed]
+            for table in ['attributes', 'identifiers', 'grades']:
+                self.connection.executemany(f'DELETE FROM {table} WHERE student = ?', [(student,) for (_, student) in changed])
+            attributes = [(student, attr, str(value)) for (row, student) in changed for (attr, value) in attributeValues(gradebook.info[row])]
+            self.connection.executemany('INSERT OR REPLACE INTO attributes (student, attr, value) VALUES (?, ?, ?)', attributes)
+            identifiers = [(primaryAttr, gradebook.studentIDs[row], student) for (row, student) in changed]
+            identifiers += [(attr, value, student) for (student, attr, value) in attributes if attr in identifying]
+            self.connection.executemany('INSERT OR REPLACE INTO identifiers (attr, value, student) VALUES (?, ?, ?)', identifiers)
+            # The identifiers map the current roster only: students no longer
+            # in the sources keep their grades, but can't be looked up by ID
+            self.connection.execute('DELETE FROM identifiers WHERE student IN (SELECT id FROM students WHERE last_run != ?)', (runID,))
+            # so that they are rewritten in full if they come back
+            self.connection.execute("UPDATE students SET signature = '' WHERE last_run != ?", (runID,))
+            self.connection.executemany('INSERT INTO grades (student, assignment, score, str_score, annotations, dropped) VALUES (?, ?, ?, ?, ?, ?)',
+                gradeRows(gradebook, changed, [assignmentIDs[name] for name in gradebook.assignmentNames]))
+        return len(changed)
+
+    def upsertAssignments(self, allAssignments):
+        '''Saves the assignments' configs and returns a dict from assignment
+        name to id'''
+        self.connection.executemany('INSERT OR IGNORE INTO assignments (name, max_points, config) VALUES (?, ?, ?)',
+            [(name, None, '') for name in allAssignments])
+        self.connection.executemany('UPDATE assignments SET max_points = ?, config = ? WHERE name = ?',
+            [(data.get('max_points'), json.dumps(data, sort_keys=True), name) for (name, data) in allAssignments.items()])
+        return dict(self.connection.execute('SELECT name, id FROM assignments'))
+
+    def findStudent(self, attr, value):
+        '''Returns the student identified by (attr, value), or None'''
+        row = self.connection.execute('''
+            SELECT students.identifier FROM identifiers
+            JOIN students ON students.id = identifiers.student
+            WHERE attr = ? AND value = ?''', (attr, value)).fetchone()
+        return row[0] if row != None else None
+
+    def studentGrades(self, studentID):
+        '''Returns a dict from assignment name to (score, annotations, dropped)
+        of the student's stored grades, in the order of the config'''
+        return {name: (strScore if strScore != None else score, json.loads(annotations) if annotations != None else {}, bool(dropped))
+            for (name, score, strScore, annotations, dropped) in self.connection.execute('''
+                SELECT assignments.name, score, str_score, annotations, dropped FROM grades
+                JOIN assignments ON assignments.id = grades.assignment
+                WHERE grades.student = (SELECT id FROM students WHERE identifier = ?)
+                ORDER BY assignments.id''', (studentID,))}
+
+    def missing(self, assignment):
+        '''Returns the students seen by the latest run who have no grade for
+        the assignment'''
+        return [studentID for (studentID,) in self.connection.execute('''
+            SELECT identifier FROM students
+            WHERE last_run = (SELECT MAX(id) FROM runs)
+            AND NOT EXISTS (
+                SELECT 1 FROM grades JOIN assignments ON assignments.id = grades.assignment
+                WHERE grades.student = students.id AND assignments.name = ?)
+            ORDER BY identifier''', (assignment,))]
+
+def attributeValues(info):
+    '''The (attr, value) pairs of a student's info; attributes with several
+    values (a set, or a sorted list once printReport has run) give one pair
+    per value'''
+    for (attr, value) in info.items():
+        if type(value) in (set, list):
+            for v in sorted(value):
+                yield (attr, v)
+        else:
+            yield (attr, value)
+
+def gradeRows(gradebook, changed, columnIDs):
+    for (row, student) in changed:
+        scores = gradebook.scores[row].tolist()
+        dropped = gradebook.dropped[row].tolist()
+        for col in np.flatnonzero(gradebook.present[row]).tolist():
+            strScore = gradebook.strScores.get((row, col))
+            annotations = gradebook.annotations.get((row, col))
+            yield (student, columnIDs[col], scores[col] if strScore == None else None, strScore,
+                json.dumps(annotations, sort_keys=True) if annotations != None else None, dropped[col])
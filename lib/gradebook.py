@@ -0,0 +1,142 @@
+import numpy as np
+
+from lib.constants import GRADE_NOT_PRESENT_ANNOTS
+
+__all__ = ['Gradebook']
+
+class Gradebook:
+    '''The scores of all students for all assignments, as a dense float matrix
+    (students x assignments) with a mask of which grades are present.
+    Annotations and non-numeric scores are rare, so they are stored sparsely
+    in dicts keyed by (row, col).
+    - studentIDs[row] is the primary identifier of the student in that row,
+      and studentIndex maps it back to the row
+    - info[row] is the dict of the student's other attributes
+    - assignmentNames[col] is the name of the assignment in that column, and
+      assignmentIndex maps it back to the column
+    - dropped is a mask (like present) of the grades dropped by
+      postprocessing, which the reports grey out and the summary omits
+    This takes about 10 bytes per grade (8 for the score and 1 for each mask),
+    i.e. about 5KB per student with 500 assignments. Scores are kept as
+    float64 so that e.g. 87.3 is reported exactly as read, which float32
+    would not do.'''
+    def __init__(self, allAssignments, capacity=64):
+        self.allAssignments = allAssignments
+        self.assignmentNames = list(allAssignments.keys())
+        self.assignmentIndex = {name: col for (col, name) in enumerate(self.assignmentNames)}
+        self.maxPoints = np.array([data.get('max_points', np.nan) for data in allAssignments.values()], dtype=float)
+        self.studentIDs = []
+        self.studentIndex = {}
+        self.info = []
+        self.scores = np.zeros((capacity, len(self.assignmentNames)))
+        self.present = np.zeros((capacity, len(self.assignmentNames)), dtype=bool)
+        self.dropped = np.zeros((capacity, len(self.assignmentNames)), dtype=bool)
+        self.annotations = {}
+        self.strScores = {}
+
+    def __len__(self):
+        return len(self.studentIDs)
+
+    def addStudent(self, studentID):
+        '''Adds an empty row for the student and returns its index'''
+        row = len(self.studentIDs)
+        if row == self.scores.shape[0]:
+            self.scores = grow(self.scores)
+            self.present = grow(self.present)
+            self.dropped = grow(self.dropped)
+        self.studentIDs.append(studentID)
+        self.studentIndex[studentID] = row
+        self.info.append({})
+        return row
+
+    def compact(self):
+        '''Releases the spare rows allocated while students were being added'''
+        self.scores = self.scores[:len(self)].copy()
+        self.present = self.present[:len(self)].copy()
+        self.dropped = self.dropped[:len(self)].copy()
+
+    def grade(self, row, col):
+        '''Returns the (score, annotations) of one grade, or
+        (0, GRADE_NOT_PRESENT_ANNOTS) if there is none'''
+        if not self.present[row, col]:
+            return (0, GRADE_NOT_PRESENT_ANNOTS)
+        score = self.strScores.get((row, col))
+        if score == None:
+            score = float(self.scores[row, col])
+        return (score, self.annotations.get((row, col), {}))
+
+    def rowGrades(self, row):
+        '''Returns the list of the student's (score, annotations) for every
+        column, as from grade() but without indexing the matrix per cell'''
+        grades = []
+        for (col, (present, score)) in enumerate(zip(self.present[row].tolist(), self.scores[row].tolist())):
+            if not present:
+                grades.append((0, GRADE_NOT_PRESENT_ANNOTS))
+            else:
+                grades.append((self.strScores.get((row, col), score), self.annotations.get((row, col), {})))
+        return grades
+
+    def setGrade(self, row, col, score, annotations):
+        if type(score) == str:
+            self.strScores[(row, col)] = score
+            score = 0
+        else:
+            self.strScores.pop((row, col), None)
+        self.scores[row, col] = score
+        self.present[row, col] = True
+        if len(annotations) > 0:
+            self.annotations[(row, col)] = annotations
+        else:
+            self.annotations.pop((row, col), None)
+
+    def mergeGrade(self, row, col, score, annotations):
+        '''Records the grade unless the student already has a higher numeric
+        score for the assignment (string scores always replace the old
+        grade). Returns the old (score, annotations), or None if there was no
+        grade yet.'''
+        if not self.present[row, col]:
+            self.setGrade(row, col, score, annotations)
+            return None
+        oldGrade = self.grade(row, col)
+        # Always keep the highest grade for each assignment (TODO: replace with more flexible policy?)
+        if type(score) == str or type(oldGrade[0]) == str or score > oldGrade[0]:
+            self.setGrade(row, col, score, annotations)
+        return oldGrade
+
+    def strScoreMask(self):
+        '''Returns a mask (like present) of the grades with non-numeric scores
+        (e.g. "EX"), which are stored as 0 in scores'''
+        mask = np.zeros(self.present.shape, dtype=bool)
+        for (row, col) in self.strScores:
+            mask[row, col] = True
+        return mask
+
+    def requireMaxPoints(self, cols, usedBy):
+        '''Returns the max_points of the columns, raising an exception naming
+        the assignments whose max_points is missing or not positive'''
+        maxPoints = self.maxPoints[cols]
+        unusable = [self.assignmentNames[col] for (col, points) in zip(cols.tolist(), maxPoints.tolist()) if not points > 0]
+        if len(unusable) > 0:
+            raise Exception(f"{usedBy} needs a positive max_points, which {', '.join(unusable)} do(es) not have")
+        return maxPoints
+
+    def rowSignatures(self):
+        '''Returns, for each row, a value that changes whenever any of the
+        student's grades, annotations or drops do'''
+        extras = [[] for _ in range(len(self))]
+        for ((row, col), annotations) in self.annotations.items():
+            extras[row].append((col, 'annotations', annotations))
+        for ((row, col), score) in self.strScores.items():
+            extras[row].append((col, 'score', score))
+        return [(self.scores[row].tobytes(), self.present[row].tobytes(), self.dropped[row].tobytes(), repr(sorted(extras[row], key=lambda x: x[:2])))
+            for row in range(len(self))]
+
+    def studentGrades(self, row):
+        '''Returns a dict from assignment name to (score, annotations) of the
+        student's present grades'''
+        return {self.assignmentNames[col]: self.grade(row, col) for col in np.flatnonzero(self.present[row])}
+
+def grow(matrix):
+    bigger = np.zeros((2 * matrix.shape[0],) + matrix.shape[1:], dtype=matrix.dtype)
+    bigger[:matrix.shape[0]] = matrix
+    return bigger
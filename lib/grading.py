@@ -0,0 +1,107 @@
+import numpy as np
+
+from lib.printing import groupByType
+
+__all__ = ['computeTotals', 'Totals']
+
+class Totals:
+    '''Weighted category and overall percentages (and letter grades) of all
+    students, as computed by computeTotals.
+    - titles[i] and weights[i] describe the i-th graded category
+    - categoryPercents is a (students x categories) matrix
+    - total[row] is the student's overall percentage, and letters[row] their
+      letter grade (None if no cutoffs are configured)
+    Percentages are NaN where a student has nothing graded yet.'''
+    def __init__(self, titles, weights, categoryPercents, total, letters):
+        self.titles = titles
+        self.weights = weights
+        self.categoryPercents = categoryPercents
+        self.total = total
+        self.letters = letters
+
+    def csvHeader(self):
+        header = [f'{title} %' for title in self.titles] + ['Total %']
+        if self.letters != None:
+            header.append('Letter Grade')
+        return header
+
+    def csvColumns(self):
+        columns = [[formatPercent(p) for p in self.categoryPercents[:, i].tolist()] for i in range(len(self.titles))]
+        columns.append([formatPercent(p) for p in self.total.tolist()])
+        if self.letters != None:
+            columns.append(self.letters)
+        return columns
+
+    def rowLines(self, row):
+        '''Returns the [(label, text)] to show on one student's report'''
+        lines = []
+        for (i, title) in enumerate(self.titles):
+            lines.append((title, f'{formatPercentOrNA(self.categoryPercents[row, i])} (weight {formatPercent(self.weights[i])})'))
+        totalStr = formatPercentOrNA(self.total[row])
+        if self.letters != None and self.letters[row] != '':
+            totalStr += f' ({self.letters[row]})'
+        lines.append(('Total', totalStr))
+        return lines
+
+def computeTotals(gradingConfigObj, gradebook):
+    '''Computes the config's "grading" section for the whole class at once.
+    Each category is scored either by "percentage" (the mean of score /
+    max_points over its assignments, so a 10/20 and a 1/2 count the same) or
+    by "points" (total score / total max_points). Missing grades count as 0
+    (and stay in the denominator); dropped grades and non-numeric scores
+    (e.g. "EX" for excused) are left out. Every graded assignment needs a
+    positive max_points. Returns a Totals.'''
+    byType = groupByType(gradebook.allAssignments)
+    kept = ~gradebook.dropped & ~gradebook.strScoreMask()
+    scores = np.where(gradebook.present, gradebook.scores, 0) * kept
+    titles = []
+    weights = []
+    percentColumns = []
+    for categoryObj in gradingConfigObj["categories"]:
+        category = categoryObj["type"]
+        mode = categoryObj.get("mode", "percentage")
+        cols = np.array([gradebook.assignmentIndex[name] for (name, _) in byType.get(category, [])], dtype=int)
+        if mode not in ["percentage", "points"]:
+            raise Exception(f"Unknown mode '{mode}' for category '{category}' in 'grading' field (expected 'percentage' or 'points')")
+        maxPoints = gradebook.requireMaxPoints(cols, f"Category '{category}' in 'grading' field")
+        if mode == "percentage":
+            numerators = (scores[:, cols] / maxPoints).sum(axis=1)
+            denominators = kept[:, cols].sum(axis=1)
+        else:
+            numerators = scores[:, cols].sum(axis=1)
+            denominators = (kept[:, cols] * maxPoints).sum(axis=1)
+        # A category with no assignments in the config yet (e.g. exams early
+        # in the term), or all of whose grades were left out, is NaN and left
+        # out of the total
+        percentColumns.append(100 * np.divide(numerators, denominators, out=np.full(len(gradebook), np.nan), where=denominators > 0))
+        titles.append(categoryObj.get("title", category))
+        weights.append(float(categoryObj["weight"]))
+
+    weights = np.array(weights)
+    categoryPercents = np.column_stack(percentColumns) if len(percentColumns) > 0 else np.zeros((len(gradebook), 0))
+    graded = ~np.isnan(categoryPercents)
+    usedWeights = graded @ weights
+    weightedSums = np.where(graded, categoryPercents, 0) @ weights
+    total = np.divide(weightedSums, usedWeights, out=np.full(len(gradebook), np.nan), where=usedWeights > 0)
+
+    letters = None
+    if "letterGrades" in gradingConfigObj:
+        # Cutoffs are checked from highest to lowest; below all of them is the
+        # letter with the lowest cutoff
+        cutoffs = sorted(gradingConfigObj["letterGrades"].items(), key=lambda item: -item[1])
+        letterNames = np.array([letter for (letter, _) in cutoffs] + [cutoffs[-1][0]], dtype=object)
+        thresholds = np.array([cutoff for (_, cutoff) in cutoffs])
+        letters = letterNames[(total[:, None] < thresholds[None, :]).sum(axis=1)].tolist()
+        letters = ['' if np.isnan(t) else letter for (t, letter) in zip(total.tolist(), letters)]
+
+    return Totals(titles, weights, categoryPercents, total, letters)
+
+def formatPercentOrNA(p):
+    return 'n/a' if np.isnan(p) else f'{formatPercent(p)}%'
+
+def formatPercent(p):
+    '''Rounds to two decimals, e.g. 87.456 -> 87.46, 90.0 -> 90. NaN (no
+    grades yet) becomes the empty string.'''
+    if np.isnan(p):
+        return ''
+    return ('%.2f' % p).rstrip('0').rstrip('.')
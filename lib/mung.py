@@ -1,14 +1,53 @@
-import re
+import re, functools
 
 def checkAndClean(s, filters):
-    for f in filters:
-        s = filtersAndChecks[f](s)
-    return s
+    return compileFilters(tuple(filters))(s)
+
+# Most score columns hold only a handful of distinct values (e.g. 0/1 in clicker
+# sessions), so each distinct value is cleaned once per filter chain per source
+MEMO_MAX_SIZE = 10000
+# Identifiers (student IDs, clicker IDs, ...) repeat across every source that
+# mentions a student; this is enough for a few thousand students
+IDENTIFIER_MEMO_SIZE = 65536
+
+@functools.lru_cache(maxsize=None)
+def compileFilters(filters, memoSize=0):
+    '''Returns one callable that applies a chain of filters (a tuple of names
+    in filtersAndChecks), looking the names up only once. The callable is
+    shared by every caller with the same chain and memoSize. With memoSize,
+    the results for the last memoSize distinct inputs are remembered; inputs
+    that fail a check are not, so they raise IncorrectFormatException on
+    every call, just as without a memo.'''
+    funcs = tuple(filtersAndChecks[f] for f in filters)
+    if len(funcs) == 1:
+        clean = funcs[0]
+    else:
+        def clean(s):
+            for f in funcs:
+                s = f(s)
+            return s
+    if memoSize > 0:
+        # typed, so that e.g. 1 and 1.0 read from xlsx cells are kept apart
+        clean = functools.lru_cache(maxsize=memoSize, typed=True)(clean)
+    return clean
+
+def checkAndCleanMemo(s, clean, memo):
+    '''Applies `clean` (from compileFilters), but looks up and records results
+    in `memo`, a dict that must only ever be used with this same callable'''
+    try:
+        return memo[s]
+    except KeyError:
+        pass
+    result = clean(s)
+    if len(memo) < MEMO_MAX_SIZE:
+        memo[s] = result
+    return result
 
 class IncorrectFormatException(Exception):
     pass
+UCSD_ID_PATTERN = re.compile(r'^[AU]\d{8}$')
 def ucsdStudentIDCheck(x):
-    if not re.fullmatch(r'^[AU]\d{8}$', x):
+    if not UCSD_ID_PATTERN.fullmatch(x):
         raise IncorrectFormatException()
     return x
 def checkNChar(x, n):
@@ -18,7 +57,7 @@ def checkNChar(x, n):
 filtersAndChecks = {
     'strip': lambda x: x.strip(),
     'ucsdIDCheck': ucsdStudentIDCheck,
-    '8char': lambda x: checkNChar(x, 8),
+    '8char': functools.partial(checkNChar, n=8),
     'remove#': lambda x: x[1:] if len(x) > 0 and x[0] == '#' else x,
     'toUpper': lambda x: x.upper(),
     'NVto0': lambda x: 0 if x == 'NV' else x,
@@ -0,0 +1,191 @@
+from html.parser import HTMLParser
+import re
+
+from lib.pdfDocument import PdfDocument, textWidth, PAGE_WIDTH, PAGE_HEIGHT
+from lib.printing import formatScore, formatAnnot, infoLines, DEFAULT_REPORTS_DIR
+
+__all__ = ['NativePdfRenderer', 'drawReport']
+
+MARGIN = 54
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+H1_SIZE = 20
+H2_SIZE = 14
+BODY_SIZE = 11
+LINE_SPACING = 1.3
+CELL_PADDING = 4
+DROPPED_GREY = 0.5
+
+class NativePdfRenderer:
+    '''Draws each student's report straight to STUDENT.pdf in reportsDir,
+    in-process, with the same layout as the html report (see drawReport).
+    Has the interface of PdfRenderer but needs no wkhtmltopdf.'''
+    def __init__(self, manifest=None, reportsDir=DEFAULT_REPORTS_DIR):
+        self.manifest = manifest
+        self.reportsDir = reportsDir
+        self.perStudent = True
+        self.failures = []
+
+    digestPrefix = 'native:'
+
+    def submit(self, studentIdentifier, digest=None, content=None):
+        try:
+            drawReport(content).save(self.reportsDir / f'{studentIdentifier}.pdf')
+        except OSError as e:
+            self.failures.append((studentIdentifier, e))
+            return
+        if self.manifest != None:
+            self.manifest.record(studentIdentifier, 'pdf', digest)
+
+    def finish(self):
+        for (studentIdentifier, e) in sorted(self.failures, key=lambda x: x[0]):
+            print(f"Error while generating pdf for {studentIdentifier}:")
+            print(f'\n<\n{e}\n>\n')
+        return self.failures
+
+def drawReport(content):
+    '''Returns a PdfDocument of one student's report from its ReportContent
+    (see lib/printing.py)'''
+    outputConfigObj = content.outputConfigObj
+    flow = Flow()
+    flow.paragraph(htmlRuns(outputConfigObj["report-name"], 'bold'), H1_SIZE)
+    flow.paragraph([('bold', 0, f'PID: {content.studentIdentifier}')], H2_SIZE)
+    for (k, v) in infoLines(content.studentInfo):
+        flow.paragraph([('bold', 0, f'{k}: {v}')], H2_SIZE)
+    flow.space(BODY_SIZE / 2)
+    flow.paragraph(htmlRuns(outputConfigObj['disclaimer-text']), BODY_SIZE)
+    for section in content.layout:
+        flow.space(H2_SIZE / 2)
+        flow.paragraph([('bold', 0, section['title'])], H2_SIZE)
+        if section['table'] == None:
+            for (assignmentName, col, maxPointsStr) in section['assignments']:
+                flow.paragraph(assignmentRuns(assignmentName, maxPointsStr, content.grades[col], content.dropped[col]), BODY_SIZE)
+        else:
+            for tableRow in section['table']:
+                cells = [assignmentRuns(name, maxPointsStr, content.grades[col], content.dropped[col]) for (name, col, maxPointsStr) in tableRow]
+                flow.tableRow(cells, max(len(r) for r in section['table']), BODY_SIZE)
+    if len(content.totalLines) > 0:
+        flow.space(H2_SIZE / 2)
+        flow.paragraph([('bold', 0, 'Totals')], H2_SIZE)
+        for (label, text) in content.totalLines:
+            flow.paragraph([('bold', 0, f'{label}:'), ('regular', 0, f' {text}')], BODY_SIZE)
+    return flow.doc
+
+def assignmentRuns(assignmentName, maxPointsStr, grade, dropped):
+    (score, annot) = grade
+    text = f"  {formatScore(score)}{maxPointsStr}{formatAnnot(annot)}"
+    if dropped:
+        return [('boldItalic', DROPPED_GREY, f'{assignmentName}:'), ('italic', DROPPED_GREY, text)]
+    return [('bold', 0, f'{assignmentName}:'), ('regular', 0, text)]
+
+class Flow:
+    '''Lays out paragraphs and table rows from the top of the page down,
+    starting new pages as needed'''
+    def __init__(self):
+        self.doc = PdfDocument()
+        self.newPage()
+
+    def newPage(self):
+        self.doc.newPage()
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def space(self, height):
+        self.y -= height
+
+    def paragraph(self, runs, size):
+        '''Draws the runs of (font, grey, text), wrapped to the page width'''
+        lineHeight = size * LINE_SPACING
+        for line in wrapRuns(runs, CONTENT_WIDTH, size):
+            if self.y - lineHeight < MARGIN:
+                self.newPage()
+            self.y -= lineHeight
+            self.drawLine(line, MARGIN, self.y + (lineHeight - size) / 2, size)
+
+    def tableRow(self, cells, columnCount, size):
+        '''Draws a row of bordered cells, each holding a list of runs'''
+        lineHeight = size * LINE_SPACING
+        cellWidth = CONTENT_WIDTH / columnCount
+        cellLines = [wrapRuns(runs, cellWidth - 2 * CELL_PADDING, size) for runs in cells]
+        height = max([len(lines) for lines in cellLines] + [1]) * lineHeight + 2 * CELL_PADDING
+        if self.y - height < MARGIN:
+            self.newPage()
+        top = self.y
+        self.y -= height
+        for (i, lines) in enumerate(cellLines):
+            left = MARGIN + i * cellWidth
+            for (j, line) in enumerate(lines):
+                baseline = top - CELL_PADDING - (j + 1) * lineHeight + (lineHeight - size) / 2
+                self.drawLine(line, left + CELL_PADDING, baseline, size)
+            self.doc.line(left, top, left + cellWidth, top)
+            self.doc.line(left, self.y, left + cellWidth, self.y)
+            self.doc.line(left, top, left, self.y)
+            self.doc.line(left + cellWidth, top, left + cellWidth, self.y)
+
+    def drawLine(self, line, x, baseline, size):
+        for (font, grey, text) in line:
+            self.doc.text(x, baseline + size * 0.2, text, font, size, grey)
+            x += textWidth(text, font, size)
+
+def wrapRuns(runs, width, size):
+    '''Splits runs of (font, grey, text) into lines no wider than `width`
+    (except for single words that are wider). A '\n' in a run's text always
+    starts a new line.'''
+    lines = [[]]
+    lineWidth = 0
+    for (font, grey, text) in runs:
+        for (i, paragraph) in enumerate(text.split('\n')):
+            if i > 0:
+                lines.append([])
+                lineWidth = 0
+            for word in re.findall(r'\s*\S+|\s+$', paragraph):
+                wordWidth = textWidth(word, font, size)
+                if lineWidth + wordWidth > width and lineWidth > 0:
+                    word = word.lstrip()
+                    wordWidth = textWidth(word, font, size)
+                    lines.append([])
+                    lineWidth = 0
+                lines[-1].append((font, grey, word))
+                lineWidth += wordWidth
+    return lines
+
+def htmlRuns(html, baseFont='regular'):
+    '''Converts the simple html allowed in the config's texts (<b>, <i>,
+    <font color=...>, <br>) to runs of (font, grey, text)'''
+    parser = RunParser(baseFont)
+    parser.feed(html)
+    parser.close()
+    return parser.runs
+
+class RunParser(HTMLParser):
+    def __init__(self, baseFont):
+        super().__init__()
+        self.bold = 1 if baseFont == 'bold' else 0
+        self.italic = 0
+        self.greys = [0]
+        self.runs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('b', 'strong'):
+            self.bold += 1
+        elif tag in ('i', 'em'):
+            self.italic += 1
+        elif tag == 'font':
+            color = dict(attrs).get('color', 'black')
+            self.greys.append(0 if color in ('black', '#000000') else DROPPED_GREY)
+        elif tag in ('br', 'p', 'div'):
+            self.runs.append(('regular', 0, '\n'))
+
+    def handle_endtag(self, tag):
+        if tag in ('b', 'strong'):
+            self.bold -= 1
+        elif tag in ('i', 'em'):
+            self.italic -= 1
+        elif tag == 'font' and len(self.greys) > 1:
+            self.greys.pop()
+
+    def handle_data(self, data):
+        text = re.sub(r'\s+', ' ', data)
+        if self.bold > 0:
+            font = 'boldItalic' if self.italic > 0 else 'bold'
+        else:
+            font = 'italic' if self.italic > 0 else 'regular'
+        self.runs.append((font, self.greys[-1], text))
@@ -0,0 +1,111 @@
+# A minimal pdf writer (text in the standard Helvetica fonts, and lines), just
+# enough to draw grade reports without any external program or package.
+
+import functools, zlib
+
+__all__ = ['PdfDocument', 'textWidth']
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+# Standard font name -> (resource name, base font)
+FONTS = {
+    'regular': ('F1', 'Helvetica'),
+    'bold': ('F2', 'Helvetica-Bold'),
+    'italic': ('F3', 'Helvetica-Oblique'),
+    'boldItalic': ('F4', 'Helvetica-BoldOblique')
+}
+
+# Glyph widths (per 1000 units of font size) of the printable ascii characters
+# ' ' to '~', from the Adobe font metrics of Helvetica and Helvetica-Bold (the
+# oblique variants have the same widths)
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584
+]
+HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584
+]
+# Used for characters outside printable ascii
+DEFAULT_WIDTH = 556
+
+def textWidth(text, font, size):
+    '''The width in points of `text` drawn in one of the FONTS at `size`'''
+    return textUnits(text, font in ('bold', 'boldItalic')) * size / 1000
+
+# Reports repeat the same short strings (scores, assignment names) many times
+@functools.lru_cache(maxsize=65536)
+def textUnits(text, bold):
+    widths = HELVETICA_BOLD_WIDTHS if bold else HELVETICA_WIDTHS
+    total = 0
+    for c in text:
+        code = ord(c)
+        total += widths[code - 32] if 32 <= code <= 126 else DEFAULT_WIDTH
+    return total
+
+@functools.lru_cache(maxsize=65536)
+def encodeText(text):
+    '''Encodes text as a pdf string literal (WinAnsiEncoding)'''
+    data = text.encode('cp1252', errors='replace')
+    data = data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return b'(' + data + b')'
+
+class PdfDocument:
+    '''Pages of drawing operations, written out as a pdf by save(). Coordinates
+    are in points from the bottom left of a US letter page.'''
+    def __init__(self):
+        self.pages = []
+
+    def newPage(self):
+        self.pages.append([])
+
+    def text(self, x, y, text, font='regular', size=11, grey=0):
+        (resource, _) = FONTS[font]
+        self.pages[-1].append(b'%.3g g BT /%s %g Tf %.2f %.2f Td %s Tj ET' % (grey, resource.encode(), size, x, y, encodeText(text)))
+
+    def line(self, x1, y1, x2, y2, width=0.5):
+        self.pages[-1].append(b'0 G %g w %.2f %.2f m %.2f %.2f l S' % (width, x1, y1, x2, y2))
+
+    def toBytes(self):
+        # Objects: 1 catalog, 2 page tree, then the fonts, then a page and
+        # its content stream for each page
+        objects = [None, None]
+        fontRefs = []
+        for (resource, baseFont) in FONTS.values():
+            objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % baseFont.encode())
+            fontRefs.append(b'/%s %d 0 R' % (resource.encode(), len(objects)))
+        pageRefs = []
+        for operations in self.pages:
+            stream = zlib.compress(b'\n'.join(operations))
+            objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(stream), stream))
+            contentNum = len(objects)
+            objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> /Contents %d 0 R >>'
+                % (PAGE_WIDTH, PAGE_HEIGHT, b' '.join(fontRefs), contentNum))
+            pageRefs.append(b'%d 0 R' % len(objects))
+        objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+        objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(pageRefs), len(pageRefs))
+
+        out = bytearray(b'%PDF-1.4\n')
+        offsets = []
+        for (i, obj) in enumerate(objects):
+            offsets.append(len(out))
+            out += b'%d 0 obj\n%s\nendobj\n' % (i + 1, obj)
+        xrefOffset = len(out)
+        out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        for offset in offsets:
+            out += b'%010d 00000 n \n' % offset
+        out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xrefOffset)
+        return bytes(out)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.toBytes())
@@ -1,78 +1,332 @@
-import pdfkit
 from pathlib import Path
-import csv
+import csv, os, json, hashlib, functools
+from xml.etree import ElementTree
+import concurrent.futures, collections
+import numpy as np
 
-from lib.constants import INFO_KEY, GRADES_KEY, GRADE_NOT_PRESENT_ANNOTS
+__all__ = ['printReport', 'makeCsvSummary', 'compileLayout', 'groupByType', 'PdfRenderer', 'BatchPdfRenderer', 'ReportManifest', 'DEFAULT_REPORTS_DIR']
 
-__all__ = ['printReport', 'makeCsvSummary']
+# Where reports are written unless another directory is given
+DEFAULT_REPORTS_DIR = Path('reports')
 
-#TODO: dropLowest
-def makeCsvSummary(attrs, students, allAssignments, outputConfigObj):
-    fields = attrs + list(allAssignments.keys())
-    reportsDir = Path('reports')
-    reportsDir.mkdir(exist_ok=True)
+def makeCsvSummary(attrs, gradebook, outputConfigObj, totals=None, reportsDir=DEFAULT_REPORTS_DIR):
+    columns = []
+    for attr in attrs:
+        if attr != "Student ID": #TODO fix this hack
+            columns.append([info.get(attr, '') for info in gradebook.info])
+        else:
+            columns.append(gradebook.studentIDs)
+    for col in range(len(gradebook.assignmentNames)):
+        columns.append(formatScoreColumn(gradebook, col))
+    header = attrs + gradebook.assignmentNames
+    if totals != None:
+        columns += totals.csvColumns()
+        header += totals.csvHeader()
+    reportsDir.mkdir(parents=True, exist_ok=True)
     with open(reportsDir / "summary.csv", 'w') as csvFile:
-        csvWriter = csv.DictWriter(csvFile, fields)
-        csvWriter.writeheader()
-        for (studentIdentifier, studentData) in students:
-            newRow = {}
-            for attr in attrs:
-                if attr != "Student ID": #TODO fix this hack
-                    newRow[attr] = studentData[INFO_KEY].get(attr, '')
-                else:
-                    newRow[attr] = studentIdentifier
-            for (assignmentName, assignmentData) in allAssignments.items():
-                (score, annot) = studentData[GRADES_KEY].get(assignmentName, (0, GRADE_NOT_PRESENT_ANNOTS))
-                newRow[assignmentName] = formatScore(score)
-            csvWriter.writerow(newRow)
-
-def printReport(studentIdentifier, studentData, allAssignments, outputConfigObj, makePdf, wkhtmltopdfPath):
+        csvWriter = csv.writer(csvFile)
+        csvWriter.writerow(header)
+        csvWriter.writerows(zip(*columns))
+
+def formatScoreColumn(gradebook, col):
+    '''Returns the formatted scores of all students for one assignment, with
+    dropped grades left blank. Each distinct score is formatted only once.'''
+    scores = np.where(gradebook.present[:, col], gradebook.scores[:, col], 0)
+    (distinct, inverse) = np.unique(scores, return_inverse=True)
+    formatted = np.array([formatScore(score) for score in distinct.tolist()], dtype=object)[inverse.ravel()]
+    for ((row, strCol), score) in gradebook.strScores.items():
+        if strCol == col:
+            formatted[row] = score
+    formatted[gradebook.dropped[:, col]] = ''
+    return formatted.tolist()
+
+def groupByType(allAssignments):
+    '''Returns a dict from each assignment type to the list of
+    (assignmentName, assignmentData) of that type, in config order'''
+    byType = {}
+    for (assignmentName, assignmentData) in allAssignments.items():
+        byType.setdefault(assignmentData['type'], []).append((assignmentName, assignmentData))
+    return byType
+
+def compileLayout(outputConfigObj, gradebook):
+    '''Works out once, for all students, which assignments appear in each
+    section of the report (outputs -> content). Returns a list with one dict
+    per section, with keys
+    - "title"
+    - "assignments": the [(assignmentName, col, maxPointsStr)] of the
+      section's type, where col is the assignment's gradebook column
+    - "table": None, or the rows of the section's table as lists of
+      (assignmentName, col, maxPointsStr)'''
+    allAssignments = gradebook.allAssignments
+    byType = groupByType(allAssignments)
+    layout = []
+    for obj in outputConfigObj["content"]:
+        section = {
+            "title": obj["title"],
+            "assignments": [(name, gradebook.assignmentIndex[name], getMaxPointsStr(data)) for (name, data) in byType.get(obj["from"], [])],
+            "table": None
+        }
+        if 'table' in obj:
+            section["table"] = [[(name, gradebook.assignmentIndex[name], getMaxPointsStr(allAssignments[name])) for name in row] for row in obj['table']]
+        layout.append(section)
+    return layout
+
+def printReport(gradebook, row, layout, outputConfigObj, pdfRenderer=None, manifest=None, totals=None, reportsDir=DEFAULT_REPORTS_DIR):
     '''This function is the main 'export' from this module.
-    Given all relevant data about one student, it prints a text report
-    to stdout and also dumps a html or pdf report to ./reports'''
-    studentInfo = studentData[INFO_KEY]
+    Given the gradebook, the row of one student in it and the layout from
+    compileLayout, it prints a text report to stdout and also dumps a html
+    report to reportsDir (./reports by default). If Totals (see lib/grading.py) are given, the
+    student's category and overall totals are added to both. If a PdfRenderer
+    is given, the report is also queued for conversion to pdf. If a
+    ReportManifest is given, reports that have not changed since the last
+    run are not rewritten.'''
+    studentIdentifier = gradebook.studentIDs[row]
+    studentInfo = gradebook.info[row]
     # turns all sets into sorted lists so it has a deterministic output that
     # we can check in the tests
     for (k,v) in studentInfo.items():
         if type(v) == set:
             studentInfo[k] = sorted(list(v))
 
-    printTextReport(studentIdentifier, studentData, allAssignments, outputConfigObj["content"])
-    writeHtmlReport(studentIdentifier, studentData, allAssignments, outputConfigObj)
+    grades = gradebook.rowGrades(row)
+    totalLines = totals.rowLines(row) if totals != None else []
+    printTextReport(studentIdentifier, studentInfo, grades, layout, totalLines)
+    dropped = gradebook.dropped[row].tolist()
+    digest = writeHtmlReport(studentIdentifier, studentInfo, grades, dropped, layout, outputConfigObj, manifest, totalLines, reportsDir)
+
+    if pdfRenderer != None:
+        pdfDigest = pdfRenderer.digestPrefix + digest
+        # Combined pdfs must include every student, changed or not
+        if manifest == None or not pdfRenderer.perStudent or not manifest.isCurrent(studentIdentifier, 'pdf', pdfDigest):
+            content = ReportContent(studentIdentifier, studentInfo, grades, dropped, layout, outputConfigObj, totalLines)
+            pdfRenderer.submit(studentIdentifier, pdfDigest, content)
+
+# Everything shown on one student's report, for pdf renderers that draw the
+# report themselves instead of converting the html
+ReportContent = collections.namedtuple('ReportContent', ['studentIdentifier', 'studentInfo', 'grades', 'dropped', 'layout', 'outputConfigObj', 'totalLines'])
+
+class ReportManifest:
+    '''Records (in manifest.json in the reports directory) a hash of the html content of each
+    student's report files, so that unchanged reports are not rewritten or
+    reconverted to pdf, and reports of students who are no longer printed are
+    removed. Delete the manifest to force all reports to be regenerated.'''
+    def __init__(self, reportsDir=DEFAULT_REPORTS_DIR):
+        self.reportsDir = reportsDir
+        self.path = reportsDir / 'manifest.json'
+        self.entries = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self.seen = set()
 
-    # Convert html report to pdf report
-    if makePdf:
+    def isCurrent(self, studentIdentifier, ext, digest):
+        '''Whether the student's .html or .pdf (`ext`) report exists and was
+        made from html with the given digest'''
+        self.seen.add(studentIdentifier)
+        entry = self.entries.get(studentIdentifier, {})
+        return entry.get(ext) == digest and (self.reportsDir / f'{studentIdentifier}.{ext}').exists()
+
+    def keep(self, studentIdentifier):
+        '''Keeps the student's report files as they are, without checking them'''
+        self.seen.add(studentIdentifier)
+
+    def record(self, studentIdentifier, ext, digest):
+        self.seen.add(studentIdentifier)
+        self.entries.setdefault(studentIdentifier, {})[ext] = digest
+
+    def save(self):
+        '''Removes the report files of students not seen during this run, then
+        writes the manifest'''
+        for studentIdentifier in sorted(set(self.entries) - self.seen):
+            for ext in self.entries.pop(studentIdentifier):
+                reportPath = self.reportsDir / f'{studentIdentifier}.{ext}'
+                if reportPath.exists():
+                    reportPath.unlink()
+        self.reportsDir.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.entries, indent=2, sort_keys=True))
+
+class PdfRenderer:
+    '''Converts html reports in reportsDir to pdf in the background, using a
+    bounded pool of threads that each run one wkhtmltopdf process at a time.
+    If an executor is given, its threads are used instead (e.g. to share one
+    pool between several courses), and it is not shut down by finish().'''
+    def __init__(self, wkhtmltopdfPath, jobs=None, manifest=None, reportsDir=DEFAULT_REPORTS_DIR, executor=None):
+        self.manifest = manifest
+        self.reportsDir = reportsDir
         try:
-            config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdfPath)
-            pdfkit.from_file(f'./reports/{studentIdentifier}.html', f'./reports/{studentIdentifier}.pdf', configuration=config)
+            self.config = pdfkitConfiguration(wkhtmltopdfPath)
         except OSError as e:
-            msg = str(e)
-            if "No wkhtmltopdf executable found" not in msg:
-                raise e
-            print("Fatal error while generating pdf:")
-            print(f'\n<\n{msg}\n>\n')
-            print("If wkhtmltopdf is already installed and adding it to your path does not resolve this error,")
-            print("you can specify its path for this program using the -w option")
-            exit(1)
+            exitMissingWkhtmltopdf(e)
+        self.ownsExecutor = executor == None
+        self.executor = executor if executor != None else concurrent.futures.ThreadPoolExecutor(jobs or os.cpu_count())
+        # Maps each future to the [(studentIdentifier, digest)] it converts
+        self.futures = {}
+        # Whether each student gets their own pdf (which the manifest tracks)
+        self.perStudent = True
+
+    # Distinguishes the pdfs of different renderers in the manifest
+    digestPrefix = ''
+
+    def submit(self, studentIdentifier, digest=None, content=None):
+        import pdfkit
+        future = self.executor.submit(pdfkit.from_file, str(self.reportsDir / f'{studentIdentifier}.html'), str(self.reportsDir / f'{studentIdentifier}.pdf'), configuration=self.config)
+        self.futures[future] = [(studentIdentifier, digest)]
+
+    def finish(self):
+        '''Waits for all queued conversions (with a progress bar) and reports
+        the students whose pdf could not be generated'''
+        import tqdm
+        failures = []
+        missingWkhtmltopdf = None
+        with tqdm.tqdm(total=sum(len(students) for students in self.futures.values())) as progress:
+            for future in concurrent.futures.as_completed(self.futures):
+                students = self.futures[future]
+                progress.update(len(students))
+                try:
+                    future.result()
+                except OSError as e:
+                    if "No wkhtmltopdf executable found" in str(e):
+                        missingWkhtmltopdf = e
+                        break
+                    failures += [(studentIdentifier, e) for (studentIdentifier, _) in students]
+                    continue
+                if self.manifest != None and self.perStudent:
+                    for (studentIdentifier, digest) in students:
+                        self.manifest.record(studentIdentifier, 'pdf', digest)
+        if missingWkhtmltopdf != None:
+            # None of the other conversions can work either; stop those not
+            # started yet and let the running ones end before exiting
+            for future in self.futures:
+                future.cancel()
+            concurrent.futures.wait(self.futures)
+            exitMissingWkhtmltopdf(missingWkhtmltopdf)
+        if self.ownsExecutor:
+            self.executor.shutdown()
+        for (studentIdentifier, e) in sorted(failures, key=lambda x: x[0]):
+            print(f"Error while generating pdf for {studentIdentifier}:")
+            print(f'\n<\n{e}\n>\n')
+        return failures
+
+class BatchPdfRenderer(PdfRenderer):
+    '''Like PdfRenderer, but converts the reports of up to `batchSize`
+    students with each wkhtmltopdf process, so that wkhtmltopdf is started
+    far fewer times. Each batch becomes one combined pdf (batch-001.pdf, ...
+    in reportsDir), and pdf-index.csv there lists the file and pages of each student.
+    With `split`, each combined pdf is instead split into the usual
+    per-student pdfs.'''
+    def __init__(self, wkhtmltopdfPath, batchSize, jobs=None, manifest=None, split=False, reportsDir=DEFAULT_REPORTS_DIR, executor=None):
+        super().__init__(wkhtmltopdfPath, jobs, manifest, reportsDir, executor)
+        self.batchSize = batchSize
+        self.split = split
+        self.perStudent = split
+        self.pending = []
+        self.batchCount = 0
+        self.index = []
+        if not split:
+            for oldPath in self.reportsDir.glob('batch-*.pdf'):
+                oldPath.unlink()
+
+    def submit(self, studentIdentifier, digest=None, content=None):
+        self.pending.append((studentIdentifier, digest))
+        if len(self.pending) >= self.batchSize:
+            self.submitBatch()
+
+    def submitBatch(self):
+        self.batchCount += 1
+        future = self.executor.submit(self.convertBatch, self.batchCount, self.pending)
+        self.futures[future] = self.pending
+        self.pending = []
+
+    def convertBatch(self, batchNum, students):
+        import pdfkit
+        pdfPath = self.reportsDir / f'batch-{batchNum:03d}.pdf'
+        outlinePath = pdfPath.with_suffix('.outline.xml')
+        htmlPaths = [str(self.reportsDir / f'{studentIdentifier}.html') for (studentIdentifier, _) in students]
+        pdfkit.from_file(htmlPaths, str(pdfPath), configuration=self.config, options={'dump-outline': str(outlinePath)})
+        try:
+            starts = readReportStarts(outlinePath.read_text())
+        except ElementTree.ParseError as e:
+            raise OSError(f"could not read the outline of {pdfPath}: {e}")
+        finally:
+            if outlinePath.exists():
+                outlinePath.unlink()
+        if len(starts) != len(students):
+            raise OSError(f"found {len(starts)} reports instead of {len(students)} in the outline of {pdfPath}")
+        if self.split:
+            splitPdf(pdfPath, [studentIdentifier for (studentIdentifier, _) in students], starts)
+            pdfPath.unlink()
+            return
+        ends = [start - 1 for start in starts[1:]] + [countPdfPages(pdfPath)]
+        for ((studentIdentifier, _), start, end) in zip(students, starts, ends):
+            self.index.append((studentIdentifier, pdfPath.name, start, end))
+
+    def finish(self):
+        if len(self.pending) > 0:
+            self.submitBatch()
+        failures = super().finish()
+        if not self.split:
+            with open(self.reportsDir / 'pdf-index.csv', 'w') as csvFile:
+                csvWriter = csv.writer(csvFile)
+                csvWriter.writerow(['Student', 'File', 'First Page', 'Last Page'])
+                csvWriter.writerows(sorted(self.index, key=lambda entry: (entry[1], entry[2])))
+        return failures
+
+def readReportStarts(outlineXml):
+    '''Returns the page on which each report starts, in order, from the
+    outline dumped by wkhtmltopdf (each report has a "PID: ..." heading)'''
+    root = ElementTree.fromstring(outlineXml)
+    return [int(item.get('page')) for item in root.iter() if item.tag.endswith('item') and item.get('title', '').startswith('PID: ')]
+
+def countPdfPages(pdfPath):
+    import pypdf
+    return len(pypdf.PdfReader(str(pdfPath)).pages)
+
+def splitPdf(pdfPath, studentIdentifiers, starts):
+    '''Writes the pages of each student in the combined pdf to STUDENT.pdf
+    in the same directory'''
+    import pypdf
+    reader = pypdf.PdfReader(str(pdfPath))
+    ends = [start - 1 for start in starts[1:]] + [len(reader.pages)]
+    for (studentIdentifier, start, end) in zip(studentIdentifiers, starts, ends):
+        writer = pypdf.PdfWriter()
+        for page in reader.pages[start - 1:end]:
+            writer.add_page(page)
+        with open(pdfPath.parent / f'{studentIdentifier}.pdf', 'wb') as f:
+            writer.write(f)
+
+@functools.lru_cache(maxsize=None)
+def pdfkitConfiguration(wkhtmltopdfPath):
+    '''Locates wkhtmltopdf once per path, however many renderers use it'''
+    # pdfkit and tqdm are only imported by runs that make pdfs
+    import pdfkit
+    return pdfkit.configuration(wkhtmltopdf=wkhtmltopdfPath)
+
+def exitMissingWkhtmltopdf(e):
+    print("Fatal error while generating pdf:")
+    print(f'\n<\n{str(e)}\n>\n')
+    print("If wkhtmltopdf is already installed and adding it to your path does not resolve this error,")
+    print("you can specify its path for this program using the -w option")
+    exit(1)
 
 #TODO: dropLowest
-def printTextReport(studentIdentifier, studentData, allAssignments, reportConfig):
-    '''Print simple text report to stdout'''
+def printTextReport(studentIdentifier, studentInfo, grades, layout, totalLines=[]):
+    '''Print simple text report to stdout. `grades` is the student's
+    (score, annotations) for each gradebook column.'''
     print('\n--------------------------')
     print(studentIdentifier)
-    for item in sorted(studentData[INFO_KEY].items()):
+    for item in sorted(studentInfo.items()):
         print(item)
-    for obj in reportConfig:
-        print(obj["title"])
-        for (assignmentName, assignmentData) in allAssignments.items():
-            if assignmentData['type'] == obj["from"]:
-                (score, annot) = studentData[GRADES_KEY].get(assignmentName, (0, GRADE_NOT_PRESENT_ANNOTS))
-                print(f"\t{assignmentName}\t{formatScore(score)}{getMaxPointsStr(assignmentData)}{formatAnnot(annot)}")
+    for section in layout:
+        print(section["title"])
+        for (assignmentName, col, maxPointsStr) in section["assignments"]:
+            (score, annot) = grades[col]
+            print(f"\t{assignmentName}\t{formatScore(score)}{maxPointsStr}{formatAnnot(annot)}")
+    if len(totalLines) > 0:
+        print("Totals")
+        for (label, text) in totalLines:
+            print(f"\t{label}\t{text}")
     print('--------------------------\n')
 
-def writeHtmlReport(studentIdentifier, studentData, allAssignments, outputConfigObj):
-    '''Write html report file'''
-    studentInfo = studentData[INFO_KEY]
+def writeHtmlReport(studentIdentifier, studentInfo, grades, dropped, layout, outputConfigObj, manifest=None, totalLines=[], reportsDir=DEFAULT_REPORTS_DIR):
+    '''Write html report file (unless the manifest says it is unchanged).
+    Returns a hash of its content.'''
     header_str = f"""
         <html>
         <h1>{outputConfigObj["report-name"]}</h1>
@@ -80,15 +334,28 @@ def writeHtmlReport(studentIdentifier, studentData, allAssignments, outputConfig
         """
     h2Str = mkInfoStr(studentInfo)
     disclaimer_str = f"<div>{outputConfigObj['disclaimer-text']}</div>"
-    assignments_str = get_assignmenthtml(studentData, allAssignments, outputConfigObj)
+    assignments_str = get_assignmenthtml(grades, dropped, layout) + getTotalsHtml(totalLines)
     total_str = f'{header_str} {h2Str} {disclaimer_str}\n{assignments_str}</body></html>'
-    reportsDir = Path('reports')
-    reportsDir.mkdir(exist_ok=True)
+    digest = hashlib.sha256(total_str.encode('utf-8')).hexdigest()
+    if manifest != None:
+        if manifest.isCurrent(studentIdentifier, 'html', digest):
+            return digest
+        manifest.record(studentIdentifier, 'html', digest)
+    reportsDir.mkdir(parents=True, exist_ok=True)
     reportPath = reportsDir / f'{studentIdentifier}.html'
     reportPath.write_text(total_str)
+    return digest
 
 def mkInfoStr(studentInfo):
     res = "<h2>"
+    for (k,v) in infoLines(studentInfo):
+        res += f"{k}: {v}<br/>\n"
+    res += "</h2><body>"
+    return res
+
+def infoLines(studentInfo):
+    '''Returns the (label, value) pairs to show for the student's info'''
+    lines = []
     for (k,v) in studentInfo.items():
         if type(v) == list:
             if len(v) == 0:
@@ -97,36 +364,41 @@ def mkInfoStr(studentInfo):
                 v = v[0]
             else:
                 k = k + "s"
-        res += f"{k}: {v}<br/>\n"
-    res += "</h2><body>"
-    return res
+        lines.append((k, v))
+    return lines
 
-def get_assignmenthtml(studentData, allAssignments, outputConfigObj):
+def get_assignmenthtml(grades, dropped, layout):
     html_str = ""
-    for obj in outputConfigObj["content"]:
-        html_str += f"<h2>{obj['title']}</h2>\n"
-        if 'table' not in obj:
-            for (assignmentName, assignmentData) in allAssignments.items():
-                if assignmentData['type'] == obj["from"]:
-                    html_str += stringForAssignment(assignmentData, assignmentName, studentData, " <br/>\n")
+    for section in layout:
+        html_str += f"<h2>{section['title']}</h2>\n"
+        if section['table'] == None:
+            for (assignmentName, col, maxPointsStr) in section['assignments']:
+                html_str += stringForAssignment(assignmentName, maxPointsStr, grades[col], dropped[col], " <br/>\n")
         else:
             html_str += "<table border=1>\n"
-            for row in obj['table']:
+            for tableRow in section['table']:
                 html_str += "<tr>\n"
-                for assignmentName in row:
+                for (assignmentName, col, maxPointsStr) in tableRow:
                     html_str += "<td>"
-                    assignmentData = allAssignments[assignmentName]
-                    html_str += stringForAssignment(assignmentData, assignmentName, studentData, " <br/></td>\n")
+                    html_str += stringForAssignment(assignmentName, maxPointsStr, grades[col], dropped[col], " <br/></td>\n")
                 html_str += "</tr>\n"
             html_str += "</table>\n"
     return html_str
 
-def stringForAssignment(assignmentData, assignmentName, studentData, suffix):
-    (score, annot) = studentData[GRADES_KEY].get(assignmentName, (0, GRADE_NOT_PRESENT_ANNOTS))
-    ogscore = f"{formatScore(score)}{getMaxPointsStr(assignmentData)}"
+def getTotalsHtml(totalLines):
+    if len(totalLines) == 0:
+        return ""
+    html_str = "<h2>Totals</h2>\n"
+    for (label, text) in totalLines:
+        html_str += f"<b>{label}:</b> {text} <br/>\n"
+    return html_str
+
+def stringForAssignment(assignmentName, maxPointsStr, grade, dropped, suffix):
+    (score, annot) = grade
+    ogscore = f"{formatScore(score)}{maxPointsStr}"
     prefix = f"<b>{assignmentName}:</b> "
     s = f"{prefix} {ogscore}{formatAnnot(annot)}"
-    if annot.get('dropped', False):
+    if dropped:
         s = f'<i><font color="grey">{s}</font></i>'
     return f"{s}{suffix}"
 
@@ -0,0 +1,87 @@
+import numpy as np
+
+from lib.printing import groupByType
+
+__all__ = ['postprocess', 'actions']
+
+#NOTE: we assume all assignments in a category are weighted equally by percentage,
+#i.e. getting a 10/20 and a 1/2 contribute the same in all aggregations #TODO: offer alternatives?
+def postprocess(actionConfigs, gradebook):
+    '''Applies each action of the config's 'processing' list, in order, to the
+    whole class at once. Drops are recorded in gradebook.dropped; cap and
+    scale change the scores themselves.'''
+    byType = groupByType(gradebook.allAssignments)
+    for actionConfig in actionConfigs:
+        name = actionConfig['action']
+        if name not in actions:
+            raise Exception(f"Unknown action '{name}' in 'processing' field (supported: {', '.join(actions)})")
+        cols = np.array([gradebook.assignmentIndex[assignmentName] for (assignmentName, _) in byType.get(actionConfig['type'], [])], dtype=int)
+        if len(cols) > 0:
+            actions[name](gradebook, cols, actionConfig)
+
+def fractions(gradebook, cols, actionConfig):
+    '''The (students x cols) matrix of score / max_points, with missing
+    grades counting as 0'''
+    maxPoints = gradebook.requireMaxPoints(cols, f"'{actionConfig['action']}' of '{actionConfig['type']}'")
+    scores = np.where(gradebook.present[:, cols], gradebook.scores[:, cols], 0)
+    return scores / maxPoints
+
+def dropKeys(gradebook, cols, actionConfig, highest):
+    '''Sort keys for choosing the grades to drop (smallest first). Grades
+    already dropped and non-numeric scores (e.g. "EX") are never chosen, so
+    their key is +inf.'''
+    keys = -fractions(gradebook, cols, actionConfig) if highest else fractions(gradebook, cols, actionConfig)
+    keys[gradebook.dropped[:, cols] | gradebook.strScoreMask()[:, cols]] = np.inf
+    return keys
+
+def dropLowest(gradebook, cols, actionConfig):
+    dropCount(gradebook, cols, actionConfig, highest=False)
+
+def dropHighest(gradebook, cols, actionConfig):
+    dropCount(gradebook, cols, actionConfig, highest=True)
+
+def keepBest(gradebook, cols, actionConfig):
+    '''Drops all but the keepCount best grades not already dropped.
+    Non-numeric scores are neither kept nor dropped.'''
+    keys = dropKeys(gradebook, cols, actionConfig, highest=True)
+    candidates = ~gradebook.strScoreMask()[:, cols]
+    gradebook.dropped[:, cols] |= candidates & ~smallest(keys, actionConfig['keepCount'])
+
+def dropCount(gradebook, cols, actionConfig, highest):
+    '''Marks dropCount (default 1) grades of each student in the columns as
+    dropped. Grades dropped by an earlier action are not chosen again.'''
+    keys = dropKeys(gradebook, cols, actionConfig, highest)
+    # Students with fewer candidates than dropCount only lose those they have
+    gradebook.dropped[:, cols] |= smallest(keys, actionConfig.get('dropCount', 1)) & ~np.isinf(keys)
+
+def smallest(keys, count):
+    '''Returns a mask of the `count` smallest keys in each row, with ties
+    going to the earlier column'''
+    count = min(count, keys.shape[1])
+    if count <= 0:
+        return np.zeros(keys.shape, dtype=bool)
+    # Only the count-th smallest key needs to be found (not a full sort):
+    # everything below it is chosen, plus as many of the keys equal to it (in
+    # column order) as are needed to make up the count
+    kth = np.partition(keys, count - 1, axis=1)[:, count - 1:count]
+    below = keys < kth
+    equal = keys == kth
+    needed = count - below.sum(axis=1, keepdims=True)
+    return below | (equal & (np.cumsum(equal, axis=1) <= needed))
+
+def cap(gradebook, cols, actionConfig):
+    '''Limits scores (e.g. with extra credit) to maxFraction of max_points'''
+    limits = actionConfig.get('maxFraction', 1) * gradebook.requireMaxPoints(cols, f"'cap' of '{actionConfig['type']}'")
+    gradebook.scores[:, cols] = np.minimum(gradebook.scores[:, cols], limits)
+
+def scale(gradebook, cols, actionConfig):
+    '''Multiplies scores by factor (e.g. to curve a category)'''
+    gradebook.scores[:, cols] *= actionConfig['factor']
+
+actions = {
+    'dropLowest': dropLowest,
+    'dropHighest': dropHighest,
+    'keepBest': keepBest,
+    'cap': cap,
+    'scale': scale
+}
@@ -0,0 +1,118 @@
+# Optional instrumentation of the pipeline stages (see main.py --profile).
+# Until enable() is called, stage() and wrapIter() do nothing.
+
+import contextlib, json, sys, time, tracemalloc
+
+__all__ = ['enable', 'stage', 'wrapIter', 'report']
+
+_profiler = None
+
+class Profiler:
+    def __init__(self, useCProfile):
+        self.stats = {}
+        self.order = []
+        self.depths = {}
+        # Peak traced memory seen by each enclosing stage so far; needed because
+        # each stage resets tracemalloc's peak when it starts
+        self.peakStack = []
+        self.cprofiles = {} if useCProfile else None
+
+    def start(self, name):
+        if name not in self.stats:
+            self.stats[name] = {'seconds': 0.0, 'calls': 0, 'peakBytes': 0}
+            self.order.append(name)
+            self.depths[name] = len(self.peakStack)
+        if len(self.peakStack) > 0:
+            self.peakStack[-1] = max(self.peakStack[-1], tracemalloc.get_traced_memory()[1])
+        resetPeak()
+        self.peakStack.append(tracemalloc.get_traced_memory()[0])
+        baseline = self.peakStack[-1]
+        self.peakStack[-1] = 0
+        return (time.perf_counter(), baseline)
+
+    def stop(self, name, token):
+        (startTime, baseline) = token
+        stat = self.stats[name]
+        stat['seconds'] += time.perf_counter() - startTime
+        stat['calls'] += 1
+        peak = max(self.peakStack.pop(), tracemalloc.get_traced_memory()[1])
+        stat['peakBytes'] = max(stat['peakBytes'], peak - baseline)
+        if len(self.peakStack) > 0:
+            self.peakStack[-1] = max(self.peakStack[-1], peak)
+        resetPeak()
+
+def resetPeak():
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        # Before Python 3.9 the only way to reset the peak is to forget all traces
+        tracemalloc.clear_traces()
+
+def enable(useCProfile=False):
+    '''Start collecting wall time, call counts and peak memory (via
+    tracemalloc) of each stage. With useCProfile, each top-level stage is also
+    run under cProfile (which slows it down).'''
+    global _profiler
+    _profiler = Profiler(useCProfile)
+    tracemalloc.start()
+
+@contextlib.contextmanager
+def stage(name):
+    '''Context manager that records the block as (one call of) stage `name`.
+    Stages can be nested; a nested stage's time also counts for its parents.'''
+    if _profiler == None:
+        yield
+        return
+    topLevel = len(_profiler.peakStack) == 0
+    token = _profiler.start(name)
+    cprofile = None
+    if topLevel and _profiler.cprofiles != None:
+        import cProfile
+        cprofile = _profiler.cprofiles.setdefault(name, cProfile.Profile())
+        cprofile.enable()
+    try:
+        yield
+    finally:
+        if cprofile != None:
+            cprofile.disable()
+        _profiler.stop(name, token)
+
+def wrapIter(name, iterator):
+    '''Records the time spent producing each item of `iterator` as stage
+    `name`, e.g. to measure a source that is read lazily while its rows are
+    being merged'''
+    if _profiler == None:
+        return iterator
+    return _wrapIter(name, iterator)
+
+def _wrapIter(name, iterator):
+    iterator = iter(iterator)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def report(jsonPath=None, cprofilePath=None):
+    '''Prints a table of the collected stats to stderr and optionally writes
+    them as json to `jsonPath`. If cProfile was enabled, the stats of the
+    slowest top-level stage are dumped to `cprofilePath`.'''
+    if _profiler == None:
+        return
+    stats = _profiler.stats
+    labels = ['  ' * _profiler.depths[name] + name for name in _profiler.order]
+    nameWidth = max([len(label) for label in labels] + [5])
+    print(f"{'stage':<{nameWidth}}  {'seconds':>9}  {'calls':>8}  {'peak MB':>9}", file=sys.stderr)
+    for (name, label) in zip(_profiler.order, labels):
+        stat = stats[name]
+        print(f"{label:<{nameWidth}}  {stat['seconds']:>9.3f}  {stat['calls']:>8}  {stat['peakBytes'] / 2**20:>9.1f}", file=sys.stderr)
+    if jsonPath != None:
+        with open(jsonPath, 'w') as f:
+            json.dump([dict(stage=name, **stats[name]) for name in _profiler.order], f, indent=2)
+    if cprofilePath != None and _profiler.cprofiles:
+        import pstats
+        hottest = max(_profiler.cprofiles, key=lambda name: stats[name]['seconds'])
+        pstats.Stats(_profiler.cprofiles[hottest]).dump_stats(cprofilePath)
+        print(f"cProfile stats of stage '{hottest}' written to `{cprofilePath}`", file=sys.stderr)
@@ -0,0 +1,104 @@
+import hashlib, json, os, pickle
+from pathlib import Path
+
+from lib.constants import ASSIGNMENTS_KEY
+
+__all__ = ['SourceCache']
+
+# Bump this whenever a change to reading or cleaning sources would change what
+# sourceToGrades returns, so that old cache entries are ignored
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+FINGERPRINTS_FILE = 'fingerprints.json'
+
+class SourceCache:
+    '''On-disk cache of the (Student, [Grade]) pairs read from each source, so
+    that re-runs (e.g. after editing only the outputs section of the config)
+    do not parse unchanged spreadsheets again.
+
+    An entry is keyed by a hash of the source file's content together with
+    everything in the config that affects how it is read (sheet, attributes,
+    assignments and the filters of the attributes). File content hashes are
+    remembered by size and mtime, so unchanged files are not even re-read.
+    When the cache grows past `maxBytes`, the least recently used entries are
+    removed.
+
+    Note that messages logged while reading a source (e.g. unreadable scores)
+    are only logged on the run that actually reads it.'''
+    def __init__(self, cacheDir, maxBytes=DEFAULT_MAX_BYTES):
+        self.cacheDir = Path(cacheDir)
+        self.maxBytes = maxBytes
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        fingerprintsPath = self.cacheDir / FINGERPRINTS_FILE
+        try:
+            self.fingerprints = json.loads(fingerprintsPath.read_text())
+        except (FileNotFoundError, ValueError):
+            self.fingerprints = {}
+
+    def fileHash(self, sourcePath):
+        '''Returns the sha256 of the file's content, reusing the one from a
+        previous run if its size and mtime have not changed'''
+        stat = os.stat(sourcePath)
+        key = str(Path(sourcePath).resolve())
+        old = self.fingerprints.get(key)
+        if old != None and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+            return old['sha256']
+        digest = hashlib.sha256(Path(sourcePath).read_bytes()).hexdigest()
+        self.fingerprints[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    def keyFor(self, sourceConfigObj, studentAttrDict):
+        usedAttrs = sourceConfigObj["attributes"].values()
+        keyObj = {
+            'version': CACHE_VERSION,
+            'content': self.fileHash(sourceConfigObj['file']),
+            'sheetName': sourceConfigObj['sheetName'],
+            'isRoster': sourceConfigObj.get('isRoster', False),
+            'attributes': sourceConfigObj['attributes'],
+            'assignments': sourceConfigObj[ASSIGNMENTS_KEY],
+            'attrFilters': {attr: studentAttrDict.get(attr, {}).get('filters') for attr in usedAttrs}
+        }
+        return hashlib.sha256(json.dumps(keyObj, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def entryPath(self, key):
+        return self.cacheDir / f'{key}.pickle'
+
+    def load(self, key):
+        '''Returns the cached list of (Student, [Grade]) pairs, or None'''
+        path = self.entryPath(key)
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        # Mark as recently used, for eviction
+        os.utime(path)
+        return data
+
+    def store(self, key, data):
+        path = self.entryPath(key)
+        tmpPath = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmpPath, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, path)
+
+    def finish(self):
+        '''Saves the file fingerprints and evicts entries over the size limit.
+        Must only be called from one process.'''
+        (self.cacheDir / FINGERPRINTS_FILE).write_text(json.dumps(self.fingerprints, indent=2, sort_keys=True))
+        entries = []
+        for path in self.cacheDir.glob('*.pickle'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        totalBytes = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            totalBytes -= size
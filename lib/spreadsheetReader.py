@@ -1,67 +1,140 @@
-import pyexcel as pe
-import openpyxl
+import itertools
+from collections import OrderedDict
+from pathlib import Path
 
-__all__ = ['getRows']
+__all__ = ['getRows', 'iterRows', 'sniffTable', 'getTable', 'getSheetNames', 'closeWorkbooks']
+
+# Open xlsx workbooks keyed by resolved path, so that each file is opened only
+# once per run (in read-only mode) and shared by sheet listing and sheet reads
+_workbooks = {}
 
 def getRows(sourcePath, isRoster=False, sheetName=None):
-    '''This function is the only 'export' from this module.
-    Returns a list of OrderedDicts where each OrderedDict is a row
-    from the spreadsheet at `sourcePath`. If the file is a UCSD
-    Roster, set `isRoster` to True. If the file is an xlsx and you
-    want only one sheet from it, set `sheetName`.
+    '''Returns a list of OrderedDicts where each OrderedDict is a row
+    from the spreadsheet at `sourcePath`. See getTable for the arguments.'''
+    return list(iterRows(sourcePath, isRoster, sheetName))
+
+def iterRows(sourcePath, isRoster=False, sheetName=None):
+    '''Like getRows, but returns an iterator that reads rows from the file
+    as they are consumed'''
+    (header, rows) = getTable(sourcePath, isRoster, sheetName)
+    return (OrderedDict(zip(header, row)) for row in rows)
+
+def sniffTable(sourcePath, isRoster=False, sheetName=None, sampleSize=1):
+    '''Returns (header, rows) like getTable, but with rows a list of at most
+    `sampleSize` OrderedDicts; the rest of the file is never read'''
+    (header, rows) = getTable(sourcePath, isRoster, sheetName)
+    try:
+        return (header, [OrderedDict(zip(header, row)) for row in itertools.islice(rows, sampleSize)])
+    finally:
+        rows.close()
+
+def getTable(sourcePath, isRoster=False, sheetName=None):
+    '''This function is the main 'export' from this module.
+    Returns a pair (header, rows) for the spreadsheet at `sourcePath`, where
+    header is the list of column names and rows is an iterator of lists of
+    strings, each the same length as header, read from the file as they are
+    consumed. If the file is a UCSD Roster, set `isRoster` to True. If the
+    file is an xlsx and you want only one sheet from it, set `sheetName`.
     Dispatches to one of the other functions below.'''
     ext = sourcePath.suffix
     if ext == '.csv':
         if sheetName != None:
             raise Exception("sheetName must be None (default) for csv")
         if isRoster:
-            return getRowsRosterCSV(sourcePath)
+            return getTableRosterCSV(sourcePath)
         else:
-            return getRowsNormalCSV(sourcePath)
+            return getTableNormalCSV(sourcePath)
     elif ext == '.xlsx':
         if sheetName == None:
             raise Exception("no sheetName for xlsx")
         if isRoster:
-            return getRowsRosterSingleSheetXLSX(sourcePath, sheetName)
+            return getTableRosterSingleSheetXLSX(sourcePath, sheetName)
         else:
-            return getRowsNormalSingleSheetXLSX(sourcePath, sheetName)
+            return getTableNormalSingleSheetXLSX(sourcePath, sheetName)
     else:
         raise Exception(f"unknown filetype: {str(sourcePath)}")
 
-def getRowsNormalCSV(sourcePath):
-    return pe.get_records(file_name=str(sourcePath), auto_detect_float=False, auto_detect_int=False, auto_detect_datetime=False)
+def getTableNormalCSV(sourcePath):
+    return toTable(getCSVValues(sourcePath))
+
+def getTableRosterCSV(sourcePath):
+    return stripRoster(getCSVValues(sourcePath))
 
-def getRowsRosterCSV(sourcePath):
-    allRows = pe.get_array(file_name=str(sourcePath), auto_detect_float=False, auto_detect_int=False, auto_detect_datetime=False)
-    return stripRoster(allRows)
+def getCSVValues(sourcePath):
+    '''Yields each row of the csv as a list of strings'''
+    # pyexcel and openpyxl are slow to import, so they are only imported once
+    # a file of their type is read
+    import pyexcel as pe
+    try:
+        yield from pe.iget_array(file_name=str(sourcePath), auto_detect_float=False, auto_detect_int=False, auto_detect_datetime=False)
+    finally:
+        pe.free_resources()
 
-def getRowsNormalSingleSheetXLSX(sourcePath, sheetname):
-    wb = openpyxl.load_workbook(filename=str(sourcePath), data_only=True)
-    ws = wb[sheetname]
-    return pe.get_records(array=[[str(x) for x in row] for row in ws.values])
+def getTableNormalSingleSheetXLSX(sourcePath, sheetname):
+    return toTable(getSheetValues(sourcePath, sheetname, 'None'))
     # rows = pe.get_records(file_name=str(sourcePath), sheet_name=sheetname, auto_detect_float=False, auto_detect_int=False, auto_detect_datetime=False)
     # if '' in rows[0].keys():
     #     #TODO: remove these once issue is resolved (https://github.com/pyexcel/pyexcel/issues/170)
     #     raise Exception(f"cannot have blank column headers in xlsx file (sheet {sheetname} of {sourcePath})")
     # return rows
 
-def getRowsRosterSingleSheetXLSX(sourcePath, sheetname):
-    allRows = pe.get_array(file_name=str(sourcePath), sheet_name=sheetname, auto_detect_float=False, auto_detect_int=False, auto_detect_datetime=False)
-    return stripRoster(allRows)
+def getTableRosterSingleSheetXLSX(sourcePath, sheetname):
+    return stripRoster(getSheetValues(sourcePath, sheetname, ''))
+
+def getSheetNames(sourcePath):
+    '''Returns the names of all sheets in the xlsx file at `sourcePath`'''
+    return getWorkbook(sourcePath).sheetnames
+
+def getWorkbook(sourcePath):
+    key = Path(sourcePath).resolve()
+    if key not in _workbooks:
+        import openpyxl
+        _workbooks[key] = openpyxl.load_workbook(filename=str(sourcePath), read_only=True, data_only=True)
+    return _workbooks[key]
+
+def closeWorkbooks():
+    '''Releases the file handles of all cached workbooks'''
+    for wb in _workbooks.values():
+        wb.close()
+    _workbooks.clear()
+
+def getSheetValues(sourcePath, sheetname, emptyStr):
+    '''Yields each row of the sheet as a list of strings, padded to the width
+    of the sheet. Empty cells become `emptyStr`.'''
+    ws = getWorkbook(sourcePath)[sheetname]
+    width = None
+    for row in ws.values:
+        if width == None:
+            width = ws.max_column or len(row)
+        yield [emptyStr if x == None else str(x) for x in row] + [emptyStr] * (width - len(row))
+
+def toTable(rows):
+    '''Splits an iterable of rows into the header (the first row) and an
+    iterator of the remaining rows. Rows of a different length than the
+    header (e.g. csv rows with trailing blank cells, which pyexcel drops when
+    streaming) are padded with empty strings or truncated.'''
+    rows = iter(rows)
+    header = next(rows, [])
+    return (header, fitRows(rows, len(header)))
+
+def fitRows(rows, width):
+    for row in rows:
+        if len(row) < width:
+            row = row + [''] * (width - len(row))
+        elif len(row) > width:
+            row = row[:width]
+        yield row
 
 def stripRoster(allRows):
     '''A UCSD roster spreadsheet begins with a table linking section IDs to SecCodes
     and instructors. We don't care about that, so skip over it.'''
     # Skip the table
-    for (rowIdx, line) in enumerate(allRows):
-        if line[0] == '':
-            break
-    allRows = allRows[rowIdx:]
+    allRows = itertools.dropwhile(lambda line: firstCell(line) != '', allRows)
     # Skip the blank line(s?) after the table
-    for (rowIdx, line) in enumerate(allRows):
-        if line[0] != '':
-            break
-    allRows = allRows[rowIdx:]
+    allRows = itertools.dropwhile(lambda line: firstCell(line) == '', allRows)
     # TODO: crash gracefully if the input was not a roster
 
-    return pe.get_records(array=allRows, auto_detect_float=False, auto_detect_int=False, auto_detect_datetime=False)
+    return toTable(allRows)
+
+def firstCell(line):
+    return line[0] if len(line) > 0 else ''
@@ -0,0 +1,83 @@
+import datetime, functools
+
+__all__ = ['parseDueDate', 'parseTimestamp', 'TimestampColumn']
+
+# Fixed formats tried on the first values of a timestamp column (Google Forms
+# exports look like '9/23/2019 10:15:32'). Two-digit years are left to
+# dateutil, which resolves the century differently from strptime.
+STRPTIME_FORMATS = [
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%Y/%m/%d %H:%M:%S',
+    '%m/%d/%Y'
+]
+# Values checked against the slow path before trusting a fixed format
+SAMPLE_SIZE = 5
+
+def parseDueDate(s):
+    '''Reads an assignment's "due_date" from the config'''
+    # dateutil is slow to import, so only runs that check due dates import it
+    import dateutil.parser
+    return dateutil.parser.parse(s)
+
+def parseTimestamp(s):
+    '''Reads a timestamp written in any format dateutil understands, or as an
+    xlsx serial date number. This is slow (mostly format guessing); use a
+    TimestampColumn for the values of a whole column.'''
+    import dateutil.parser
+    try:
+        return dateutil.parser.parse(s)
+    except ValueError:
+        # Try reading as an xlsx timestamp instead
+        # https://gist.github.com/erikvullings/825283249a5b4617d0f36bcba4fa8be8
+        utcTime = (float(s) - 25569) * 86400
+        return datetime.datetime.utcfromtimestamp(utcTime)
+
+def parseXlsxSerial(s):
+    value = float(s)
+    # dateutil reads shorter or longer numbers as dates (e.g. '20190923'), so
+    # only 5-digit day numbers (the years 1927 to 2173) take this path
+    if not 10000 <= value < 100000:
+        raise ValueError(s)
+    return datetime.datetime.utcfromtimestamp((value - 25569) * 86400)
+
+def fixedFormatParsers():
+    parsers = [datetime.datetime.fromisoformat, parseXlsxSerial]
+    for fmt in STRPTIME_FORMATS:
+        parsers.append(functools.partial(lambda fmt, s: datetime.datetime.strptime(s, fmt), fmt))
+    return parsers
+
+class TimestampColumn:
+    '''Parses the values of one timestamp column exactly as parseTimestamp
+    would. The first SAMPLE_SIZE values are parsed the slow way and used to
+    pick a fixed format that agrees on all of them; later values are parsed
+    with that format, falling back to parseTimestamp for any that don't fit.'''
+    def __init__(self):
+        self.candidates = fixedFormatParsers()
+        self.samplesLeft = SAMPLE_SIZE
+        self.fastParse = None
+
+    def parse(self, s):
+        if self.samplesLeft > 0:
+            return self.sample(s)
+        if self.fastParse != None:
+            try:
+                return self.fastParse(s)
+            except ValueError:
+                pass
+        return parseTimestamp(s)
+
+    def sample(self, s):
+        result = parseTimestamp(s)
+        self.candidates = [parser for parser in self.candidates if agrees(parser, s, result)]
+        self.samplesLeft -= 1
+        if self.samplesLeft == 0 and len(self.candidates) > 0:
+            self.fastParse = self.candidates[0]
+        return result
+
+def agrees(parser, s, expected):
+    try:
+        result = parser(s)
+    except ValueError:
+        return False
+    return result == expected and result.tzinfo == expected.tzinfo
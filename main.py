@@ -1,7 +1,5 @@
-import datetime, argparse
-import dateutil.parser
+import argparse, multiprocessing, collections, json, os, time
 from pathlib import Path
-import tqdm
 
 import logging
 logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.ERROR)
@@ -18,67 +16,103 @@ class DuplicateFilter(logging.Filter):
         return retVal
 logger.addFilter(DuplicateFilter())
 
-from lib.spreadsheetReader import getRows
-from lib.printing import printReport, makeCsvSummary
-from lib.constants import INFO_KEY, GRADES_KEY, ASSIGNMENTS_KEY, ALL_DEFAULT_FILTERS, GRADE_NOT_PRESENT_ANNOTS
-from lib.mung import IncorrectFormatException, checkAndClean
-from lib.config import loadConfig
+from lib.spreadsheetReader import getTable, closeWorkbooks
+from lib.printing import printReport, makeCsvSummary, compileLayout, PdfRenderer, BatchPdfRenderer, ReportManifest, DEFAULT_REPORTS_DIR
+from lib.constants import ASSIGNMENTS_KEY, ALL_DEFAULT_FILTERS
+from lib.mung import IncorrectFormatException, compileFilters, checkAndCleanMemo, IDENTIFIER_MEMO_SIZE
+from lib.config import loadConfig, findPrimaryAttr
+from lib.sourceCache import SourceCache
+from lib.timestamps import parseDueDate, TimestampColumn
+from lib.gradebook import Gradebook
+from lib.processing import postprocess
+from lib.grading import computeTotals
+from lib import profiling
+
+def planSource(sourceConfigObj, studentAttrDict, header):
+    '''Resolves the columns named in a source config against the header of the
+    source, so that rows can be read by position. Missing columns are reported
+    (once) here and then ignored.
+    Returns ([(identIdx, internalName, filters)], [(assignment, scoreIdx, timestampIdx, filters)]),
+    where scoreIdx is None for full-credit-for-completion assignments and
+    timestampIdx is None if there is no due date to check.'''
+    sourcePath = sourceConfigObj['file']
+    # Later columns win if a header is duplicated (as with the old per-row dicts)
+    columns = {col: idx for (idx, col) in enumerate(header)}
+
+    identPlan = []
+    for (identCol, internalName) in sourceConfigObj["attributes"].items():
+        if identCol not in columns:
+            logger.error(f"In file '{sourcePath}', expected column '{identCol}' for attribute '{internalName}' not found; ignoring this attribute")
+            continue
+        identPlan.append((columns[identCol], internalName, studentAttrDict[internalName]['filters']))
+
+    assignmentPlan = []
+    for assignment in sourceConfigObj[ASSIGNMENTS_KEY]:
+        scoreCol = assignment.get('scoreCol', None)
+        scoreIdx = None
+        if scoreCol != None:
+            if scoreCol not in columns:
+                logger.error(f"In file '{sourcePath}', expected score column '{scoreCol}' for assignment '{assignment['name']}' not found; ignoring this assignment")
+                continue
+            scoreIdx = columns[scoreCol]
+        timestampIdx = None
+        if "due_date" in assignment:
+            timestampCol = assignment['timestampCol']
+            if timestampCol not in columns:
+                logger.error(f"In file '{sourcePath}', expected timestamp column '{timestampCol}' for assignment '{assignment['name']}' not found; not checking due date")
+            else:
+                timestampIdx = columns[timestampCol]
+        assignmentPlan.append((assignment, scoreIdx, timestampIdx, assignment.get('filters', ALL_DEFAULT_FILTERS)))
+
+    return (identPlan, assignmentPlan)
 
 def sourceToGrades(sourceConfigObj, studentAttrDict):
-    '''returns [(Student, [Grade])]'''
+    '''yields (Student, [Grade]) pairs, one per row, as the rows are read'''
     sourcePath = Path(sourceConfigObj['file'])
-    rows = getRows(sourcePath, isRoster=sourceConfigObj.get("isRoster", False), sheetName=sourceConfigObj["sheetName"])
-    identDict = sourceConfigObj["attributes"]
-    sourceConfigReader = sourceConfigObj[ASSIGNMENTS_KEY]
-    outputList = []
+    (header, rows) = getTable(sourcePath, isRoster=sourceConfigObj.get("isRoster", False), sheetName=sourceConfigObj["sheetName"])
+    (identPlan, assignmentPlan) = planSource(sourceConfigObj, studentAttrDict, header)
+    # Each filter chain is compiled once; identifiers are also memoized
+    # (across sources), since the same IDs turn up in every source
+    identPlan = [(identIdx, internalName, compileFilters(tuple(filters), IDENTIFIER_MEMO_SIZE if studentAttrDict[internalName]['identifiesStudent'] else 0))
+        for (identIdx, internalName, filters) in identPlan]
+    # Score columns with the same filters (e.g. a block of clicker sessions)
+    # share one memo of already-cleaned values
+    memos = {}
+    # Due dates are parsed once, and each timestamp column works out its own
+    # format from its first values (see lib/timestamps.py)
+    scorePlan = [(assignment, scoreIdx, compileFilters(tuple(filters)), memos.setdefault(tuple(filters), {}),
+            None if timestampIdx == None else (timestampIdx, parseDueDate(assignment['due_date']), TimestampColumn()))
+        for (assignment, scoreIdx, timestampIdx, filters) in assignmentPlan]
     for record in rows:
         studentInfo = {}
-        for (identCol, internalName) in identDict.items():
-            identVal = record[identCol]
+        for (identIdx, internalName, clean) in identPlan:
+            identVal = record[identIdx]
             try:
-                studentInfo[internalName] = checkAndClean(identVal, studentAttrDict[internalName]['filters'])
+                studentInfo[internalName] = clean(identVal)
             except IncorrectFormatException:
                 logger.info(f"in file {sourcePath}, invalid value for {internalName}: '{identVal}'")
                 logger.info(f"skipping this field; may result in an UnidentifiableStudentException later")
         grades = {}
-        for assignment in sourceConfigReader:
-            scoreCol = assignment.get('scoreCol', None)
-            if scoreCol == None:
+        for (assignment, scoreIdx, clean, memo, lateCheck) in scorePlan:
+            if scoreIdx == None:
                 # Full credit for completion (i.e. being in the spreadsheet at all)
                 score = assignment['max_points']
             else:
+                score = record[scoreIdx]
                 try:
-                    score = record[scoreCol]
-                except:
-                    logger.error(f"In file '{str(sourcePath)}', expected score column '{scoreCol}' for assignment '{assignment['name']}' not in record '{record}'")
-                try:
-                    score = checkAndClean(score, assignment.get('filters', ALL_DEFAULT_FILTERS))
+                    score = checkAndCleanMemo(score, clean, memo)
                 except IncorrectFormatException:
-                    logger.error(f"in file {sourcePath}, unreadable score for score column {scoreCol}: '{score}'")
+                    logger.error(f"in file {sourcePath}, unreadable score for score column {assignment['scoreCol']}: '{score}'")
             annotations = {}
-            if "due_date" in assignment:
-                dueDatetime = dateutil.parser.parse(assignment['due_date'])
-                turnedInStr = record[assignment['timestampCol']]
-                try:
-                    turninDatetime = dateutil.parser.parse(turnedInStr)
-                except ValueError:
-                    # Try reading as an xlsx timestamp instead
-                    # https://gist.github.com/erikvullings/825283249a5b4617d0f36bcba4fa8be8
-                    utcTime = (float(turnedInStr) - 25569) * 86400
-                    turninDatetime = datetime.datetime.utcfromtimestamp(utcTime)
+            if lateCheck != None:
+                (timestampIdx, dueDatetime, timestampColumn) = lateCheck
+                turninDatetime = timestampColumn.parse(record[timestampIdx])
                 if turninDatetime > dueDatetime:
                     score = 0
                     annotations['shortAnnot'] = f'late - received {turninDatetime.strftime("%b %d, %T")}'
                     annotations['longAnnot'] = f'due {dueDatetime.strftime("%b %d, %T")}; received {turninDatetime.strftime("%b %d, %T")}'
             grades[assignment['name']] = (score, annotations)
-        outputList.append((studentInfo, grades))
-    return outputList
-
-def findPrimaryAttr(attrDict):
-    for (attr, flags) in attrDict.items():
-        if flags["identifiesStudent"] and flags["onePerStudent"]:
-            return attr
-    logger.error("no primary student identifier")
+        yield (studentInfo, grades)
 
 class UnidentifiableStudentException(Exception):
     pass
@@ -93,15 +127,17 @@ def getStudentID(studentAttrDict, primaryAttr, roster, studentInfo):
             return roster[key][val]
     raise UnidentifiableStudentException()
 
-def mergeIntoRoster(studentAttrDict, primaryAttr, roster, studentInfo, studentID):
+def mergeIntoRoster(studentAttrDict, primaryAttr, roster, gradebook, studentInfo, studentID):
+    '''Returns a list of the (key, val) identifiers newly linked to studentID'''
     try:
-        checkMerge(studentAttrDict, primaryAttr, roster, studentInfo, studentID)
+        checkMerge(studentAttrDict, primaryAttr, roster, gradebook, studentInfo, studentID)
     except Exception as e:
         logger.warning(e)
-        return
-    if studentID not in roster[primaryAttr]:
-        roster[primaryAttr][studentID] = {INFO_KEY: {}, GRADES_KEY: {}}
-    oldInfo = roster[primaryAttr][studentID][INFO_KEY]
+        return []
+    newIdentifiers = []
+    if studentID not in gradebook.studentIndex:
+        gradebook.addStudent(studentID)
+    oldInfo = gradebook.info[gradebook.studentIndex[studentID]]
     for (key, val) in studentInfo.items():
         if key == primaryAttr:
             continue
@@ -123,14 +159,16 @@ def mergeIntoRoster(studentAttrDict, primaryAttr, roster, studentInfo, studentID
                 roster[key] = {}
             if val not in roster[key]:
                 roster[key][val] = studentID
+                newIdentifiers.append((key, val))
             elif roster[key][val] != studentID:
                 raise Exception("This state should be unreachable (see checkMerge)")
+    return newIdentifiers
 
-def checkMerge(studentAttrDict, primaryAttr, roster, studentInfo, studentID):
-    if studentID not in roster[primaryAttr]:
+def checkMerge(studentAttrDict, primaryAttr, roster, gradebook, studentInfo, studentID):
+    if studentID not in gradebook.studentIndex:
         oldInfo = {}
     else:
-        oldInfo = roster[primaryAttr][studentID][INFO_KEY]
+        oldInfo = gradebook.info[gradebook.studentIndex[studentID]]
     for (key, val) in studentInfo.items():
         if key == primaryAttr:
             continue
@@ -150,49 +188,227 @@ def checkMerge(studentAttrDict, primaryAttr, roster, studentInfo, studentID):
             elif roster[key][val] != studentID:
                 raise Exception(f"refusing to reassign ({key}: {val}) from {roster[key][val]} to {studentID}")
 
-def gatherData(globalConfigObj):
+def mergeRow(studentAttrDict, primaryAttr, roster, gradebook, studentInfo, grades):
+    '''Merges one row into the roster and gradebook. Returns the list of
+    (key, val) identifiers that it newly linked to a student, or None if the
+    row could not (yet) be identified as belonging to any student'''
+    try:
+        studentID = getStudentID(studentAttrDict, primaryAttr, roster, studentInfo)
+    except UnidentifiableStudentException:
+        return None
+    newIdentifiers = mergeIntoRoster(studentAttrDict, primaryAttr, roster, gradebook, studentInfo, studentID)
+    row = gradebook.studentIndex.get(studentID)
+    if row == None:
+        # The merge was refused (see checkMerge) for a student not seen yet
+        return newIdentifiers
+    for (k,v) in grades.items():
+        oldGrade = gradebook.mergeGrade(row, gradebook.assignmentIndex[k], v[0], v[1])
+        if oldGrade != None:
+            logger.warning(f'Duplicate grade: {(oldGrade, studentInfo, grades)}')
+    return newIdentifiers
+
+def mergeOrDefer(studentAttrDict, primaryAttr, roster, gradebook, deferred, waiting, studentInfo, grades):
+    '''Merges one row into the roster, or if it can not be identified yet,
+    defers it: the row is appended to `waiting` and indexed in `deferred` by
+    each of its identifying (key, val) pairs. Whenever a merge links a new
+    identifier to a student, the rows waiting on it are merged in turn, so
+    that chains of identifiers (e.g. clicker ID -> registration form ->
+    student ID) are resolved without rescanning all unmerged rows.'''
+    queue = collections.deque([(studentInfo, grades, None)])
+    while len(queue) > 0:
+        (studentInfo, grades, waitIdx) = queue.popleft()
+        if waitIdx != None:
+            if waiting[waitIdx] == None:
+                # Already merged via another of its identifiers
+                continue
+            waiting[waitIdx] = None
+        newIdentifiers = mergeRow(studentAttrDict, primaryAttr, roster, gradebook, studentInfo, grades)
+        if newIdentifiers == None:
+            if waitIdx == None:
+                for (key, val) in studentInfo.items():
+                    if studentAttrDict[key]['identifiesStudent']:
+                        deferred.setdefault((key, val), []).append(len(waiting))
+                waiting.append((studentInfo, grades))
+            else:
+                waiting[waitIdx] = (studentInfo, grades)
+            continue
+        for identifier in newIdentifiers:
+            for idx in deferred.pop(identifier, []):
+                if waiting[idx] != None:
+                    queue.append(waiting[idx] + (idx,))
+
+def readSource(args):
+    '''Worker for iterSourceData: returns the (Student, [Grade]) pairs of one
+    source as a list'''
+    (sourceConfigObj, studentAttrDict, cache, cacheKey) = args
+    if cache != None:
+        data = cache.load(cacheKey)
+        if data != None:
+            return data
+    data = list(sourceToGrades(sourceConfigObj, studentAttrDict))
+    if cache != None:
+        cache.store(cacheKey, data)
+    return data
+
+def iterSourceData(sourceConfigList, studentAttrDict, jobs, cache=None):
+    '''Yields the (Student, [Grade]) pairs of all sources, in config order.
+    With more than one job, sources are read in parallel by a pool of worker
+    processes (each source is then held in memory until it is merged). If a
+    SourceCache is given, unchanged sources are loaded from it instead.'''
+    cacheKeys = [cache.keyFor(obj, studentAttrDict) if cache != None else None for obj in sourceConfigList]
+    if jobs <= 1:
+        for (obj, cacheKey) in zip(sourceConfigList, cacheKeys):
+            stageName = sourceStageName(obj)
+            with profiling.stage(stageName):
+                data = cache.load(cacheKey) if cache != None else None
+            if data != None:
+                yield from data
+                continue
+            data = []
+            for pair in profiling.wrapIter(stageName, sourceToGrades(obj, studentAttrDict)):
+                if cache != None:
+                    data.append(pair)
+                yield pair
+            if cache != None:
+                cache.store(cacheKey, data)
+        return
+    # Workbooks opened while loading the config must not be shared with the
+    # forked workers
+    closeWorkbooks()
+    with multiprocessing.Pool(jobs) as pool:
+        args = [(obj, studentAttrDict, cache, cacheKey) for (obj, cacheKey) in zip(sourceConfigList, cacheKeys)]
+        for data in pool.imap(readSource, args):
+            yield from data
+
+def sourceStageName(sourceConfigObj):
+    '''Names the stage for reading a source when profiling'''
+    name = f"source {sourceConfigObj['file']}"
+    if sourceConfigObj['sheetName'] != None:
+        name += f" [{sourceConfigObj['sheetName']}]"
+    return name
+
+def gatherData(globalConfigObj, jobs=1, cache=None):
+    sourceData = iterSourceData(globalConfigObj["sources"], globalConfigObj["studentAttributes"], jobs, cache)
+    (gradebook, allAssignments) = mergeSources(globalConfigObj, sourceData)
+    closeWorkbooks()
+    if cache != None:
+        cache.finish()
+    return (gradebook, allAssignments)
+
+def mergeSources(globalConfigObj, sourceData):
+    '''Merges the (Student, [Grade]) pairs of all sources, in config order, into
+    a new Gradebook. Returns (gradebook, allAssignments).'''
     studentAttrDict = globalConfigObj["studentAttributes"]
     primaryAttr = findPrimaryAttr(studentAttrDict)
-    roster = {k:{} for k in studentAttrDict}
+    # Maps each identifier value to the student's primary identifier; the
+    # students themselves are kept in the gradebook
+    roster = {k:{} for k in studentAttrDict if k != primaryAttr}
 
     sourceConfigList = globalConfigObj["sources"]
     allAssignments = {}
     for obj in sourceConfigList:
         for assignmentData in obj[ASSIGNMENTS_KEY]:
             allAssignments[assignmentData["name"]] = assignmentData
+    gradebook = Gradebook(allAssignments)
 
-    data = []
-    for obj in sourceConfigList:
-        data += sourceToGrades(obj, studentAttrDict)
+    # Rows are merged as they are read; only rows that cannot be identified yet
+    # (e.g. by a clicker ID whose registration comes from a later source) are kept
+    deferred = {}
+    waiting = []
+    for (studentInfo, grades) in sourceData:
+        mergeOrDefer(studentAttrDict, primaryAttr, roster, gradebook, deferred, waiting, studentInfo, grades)
+    gradebook.compact()
 
-    while True:
-        newDataMerged = False
-        failedToMerge = []
-        for (studentInfo, grades) in data:
-            try:
-                studentID = getStudentID(studentAttrDict, primaryAttr, roster, studentInfo)
-            except UnidentifiableStudentException:
-                failedToMerge.append((studentInfo, grades))
+    for row in waiting:
+        if row != None:
+            logger.warning(f"could not identify student ({row[0]})")
+
+    return (gradebook, allAssignments)
+
+def generateReports(globalConfigObj, gradebook, args, reportSignatures=None, reportsDir=DEFAULT_REPORTS_DIR, pdfExecutor=None):
+    '''Postprocesses the gradebook and writes the csv summary and each
+    student's reports (and pdfs, if args.pdf) to reportsDir. If
+    reportSignatures (a dict from student to a signature of their report's
+    content) is given, only reports whose signature changed are written, and
+    the dict is updated. Pdfs are converted by the threads of pdfExecutor if
+    one is given. Returns a ReportRun, whose finish() must be called to wait
+    for the pdfs and save the manifest.'''
+    printFilters = []
+    for (k,v) in globalConfigObj["studentAttributes"].items():
+        if v.get("onlyPrintIfPresent", False):
+            printFilters.append(k)
+    with profiling.stage('postprocess'):
+        postprocess(globalConfigObj['processing'], gradebook)
+    totals = None
+    if globalConfigObj.get('grading') != None:
+        with profiling.stage('computeTotals'):
+            totals = computeTotals(globalConfigObj['grading'], gradebook)
+    with profiling.stage('makeCsvSummary'):
+        makeCsvSummary(list(globalConfigObj["studentAttributes"].keys()), gradebook, globalConfigObj["outputs"], totals, reportsDir)
+    # Pdfs are generated in the background while the remaining html reports
+    # are written
+    manifest = ReportManifest(reportsDir)
+    pdfRenderer = None
+    if args.pdf and args.pdf_backend == 'native':
+        from lib.nativePdf import NativePdfRenderer
+        pdfRenderer = NativePdfRenderer(manifest, reportsDir)
+    elif args.pdf and args.pdf_batch:
+        pdfRenderer = BatchPdfRenderer(args.wkhtmltopdf_path, args.pdf_batch, args.pdf_jobs, manifest, args.pdf_split, reportsDir, pdfExecutor)
+    elif args.pdf:
+        pdfRenderer = PdfRenderer(args.wkhtmltopdf_path, args.pdf_jobs, manifest, reportsDir, pdfExecutor)
+    if pdfRenderer != None and not pdfRenderer.perStudent:
+        # Combined pdfs must include every student, changed or not
+        reportSignatures = None
+    written = 0
+    with profiling.stage('reports'):
+        layout = compileLayout(globalConfigObj["outputs"], gradebook)
+        if reportSignatures != None:
+            rowSignatures = gradebook.rowSignatures()
+        for row in range(len(gradebook)):
+            if not shouldPrint(printFilters, gradebook.info[row]):
                 continue
-            newDataMerged = True
-            mergeIntoRoster(studentAttrDict, primaryAttr, roster, studentInfo, studentID)
-            for (k,v) in grades.items():
-                oldGrade = roster[primaryAttr][studentID][GRADES_KEY].get(k,(-float('inf'), None))
-                if oldGrade != (-float('inf'), None):
-                    logger.warning(f'Duplicate grade: {(oldGrade, studentInfo, grades)}')
-                # Always keep the highest grade for each assignment (TODO: replace with more flexible policy?)
-                if type(v[0]) != str:
-                    roster[primaryAttr][studentID][GRADES_KEY][k] = max(oldGrade, v)
-                else:
-                    roster[primaryAttr][studentID][GRADES_KEY][k] = v
-        if newDataMerged == False or len(failedToMerge) == 0:
-            break
-        data = failedToMerge[:]
-
-    for (studentInfo, _) in failedToMerge:
-        logger.warning(f"could not identify student ({studentInfo})")
-
-    return (roster[primaryAttr], allAssignments)
+            if reportSignatures != None:
+                studentIdentifier = gradebook.studentIDs[row]
+                signature = reportSignature(gradebook, row, rowSignatures[row], totals)
+                if reportSignatures.get(studentIdentifier) == signature:
+                    manifest.keep(studentIdentifier)
+                    continue
+                reportSignatures[studentIdentifier] = signature
+            printReport(gradebook, row, layout, globalConfigObj["outputs"], pdfRenderer, manifest, totals, reportsDir)
+            written += 1
+    return ReportRun(written, pdfRenderer, manifest, reportSignatures)
+
+class ReportRun:
+    '''The reports written by generateReports, whose pdfs may still be being
+    generated. Finishing is separate so that the pdfs of several courses can
+    share one pool of wkhtmltopdf threads at the same time (see batch.py).'''
+    def __init__(self, written, pdfRenderer, manifest, reportSignatures):
+        self.written = written
+        self.pdfRenderer = pdfRenderer
+        self.manifest = manifest
+        self.reportSignatures = reportSignatures
+
+    def finish(self):
+        '''Waits for the pdfs and saves the manifest. Returns the
+        (studentIdentifier, error) of each pdf that failed.'''
+        failures = []
+        if self.pdfRenderer != None:
+            # Progress bar only when generating pdfs (which is slow). Non-pdf
+            # version is fast enough that progress bar is just unnecessary clutter
+            with profiling.stage('pdf'):
+                failures = self.pdfRenderer.finish()
+            if self.reportSignatures != None:
+                # Retry these on the next run
+                for (studentIdentifier, _) in failures:
+                    self.reportSignatures.pop(studentIdentifier, None)
+        self.manifest.save()
+        return failures
+
+def reportSignature(gradebook, row, rowSignature, totals):
+    '''Everything about one student that their report shows'''
+    info = {k: sorted(v) if type(v) == set else v for (k, v) in gradebook.info[row].items()}
+    totalLines = totals.rowLines(row) if totals != None else []
+    return (repr(info), rowSignature, repr(totalLines))
 
 def shouldPrint(printFilters, studentInfo):
     for attr in printFilters:
@@ -200,47 +416,157 @@ def shouldPrint(printFilters, studentInfo):
             return False
     return True
 
-#NOTE: we assume all assignments in a category are weighted equally by percentage,
-#i.e. getting a 10/20 and a 1/2 contribute the same in all aggregations #TODO: offer alternatives?
-def postprocess(actions, students, allAssignments):
-    for action in actions:
-        if action['action'] != "dropLowest":
-            raise Exception("Unknown action in 'processing' field (only dropLowest is supported)")
-        category = action['type']
-        dropCount = action.get('dropCount', 1)
-        for student in students:
-            studentData = student[1]
-            grades = []
-            for (assignmentName, assignmentData) in allAssignments.items():
-                if assignmentData['type'] == category:
-                    (score, annot) = studentData[GRADES_KEY].get(assignmentName, (0, GRADE_NOT_PRESENT_ANNOTS))
-                    grades.append((score/assignmentData['max_points'], annot))
-            grades.sort()
-            for grade in grades[:dropCount]:
-                annot = grade[1]
-                annot['dropped'] = True
+class Watcher:
+    '''Regenerates the reports whenever the config file or one of its sources
+    changes (see --watch). The data read from each source is kept between
+    runs, so only sources whose file changed are read again; the students
+    are then re-merged from memory, and only reports whose content changed
+    are rewritten.'''
+    def __init__(self, configPath, args, reportsDir=DEFAULT_REPORTS_DIR):
+        self.configPath = Path(configPath)
+        self.args = args
+        self.reportsDir = reportsDir
+        self.globalConfigObj = None
+        # File path -> (mtime, size) when last read
+        self.stamps = {}
+        # sourceKey -> the source's (Student, [Grade]) pairs
+        self.sourceData = {}
+        self.reportSignatures = {}
+        # Files changed since the last successful update
+        self.pending = set()
+
+    def watchedFiles(self):
+        files = [self.configPath]
+        if self.globalConfigObj != None:
+            files += sorted(set(Path(obj['file']) for obj in self.globalConfigObj["sources"]))
+        return files
+
+    def currentStamps(self):
+        return {path: fileStamp(path) for path in self.watchedFiles()}
+
+    def run(self, interval):
+        self.update()
+        logger.info(f"Watching {len(self.watchedFiles())} files for changes (Ctrl-C to stop)")
+        try:
+            while True:
+                time.sleep(interval)
+                stamps = self.currentStamps()
+                if stamps == self.stamps:
+                    continue
+                # Wait for files that are still being written
+                time.sleep(interval)
+                if self.currentStamps() != stamps:
+                    continue
+                self.update()
+        except KeyboardInterrupt:
+            pass
+
+    def update(self):
+        '''Brings the reports up to date. Errors (e.g. a half-downloaded source)
+        are reported, and the update is retried on the next change.'''
+        start = time.perf_counter()
+        # Problems still present in re-read sources are reported again
+        DuplicateFilter.msgs.clear()
+        newStamps = self.currentStamps()
+        changed = self.pending.union(path for (path, stamp) in newStamps.items() if self.stamps.get(path) != stamp)
+        self.stamps = newStamps
+        try:
+            if self.configPath in changed:
+                self.globalConfigObj = loadConfig(self.configPath)
+                # The layout may have changed, so every report is rewritten
+                self.reportSignatures = {}
+                # Start watching any new sources
+                self.stamps = self.currentStamps()
+            studentAttrDict = self.globalConfigObj["studentAttributes"]
+            sourceData = {}
+            for obj in self.globalConfigObj["sources"]:
+                key = sourceKey(obj, studentAttrDict)
+                if key in self.sourceData and Path(obj['file']) not in changed:
+                    sourceData[key] = self.sourceData[key]
+                elif key not in sourceData:
+                    logger.info(f"Reading {obj['file']}{' [' + obj['sheetName'] + ']' if obj['sheetName'] != None else ''}")
+                    sourceData[key] = list(sourceToGrades(obj, studentAttrDict))
+            closeWorkbooks()
+            self.sourceData = sourceData
+            allPairs = (pair for obj in self.globalConfigObj["sources"] for pair in sourceData[sourceKey(obj, studentAttrDict)])
+            (gradebook, _) = mergeSources(self.globalConfigObj, allPairs)
+            reportRun = generateReports(self.globalConfigObj, gradebook, self.args, self.reportSignatures, self.reportsDir)
+            reportRun.finish()
+        except Exception as e:
+            closeWorkbooks()
+            logger.error(f"Could not update the reports ({type(e).__name__}: {e}); will retry on the next change")
+            self.pending = changed
+            return
+        self.pending = set()
+        logger.info(f"Updated {reportRun.written} reports in {time.perf_counter() - start:.1f}s")
+
+def fileStamp(path):
+    '''(mtime, size) of the file, or None if it does not exist'''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def sourceKey(sourceConfigObj, studentAttrDict):
+    '''Everything in the config that affects what is read from a source'''
+    attrFilters = {attr: studentAttrDict[attr]['filters'] for attr in sourceConfigObj["attributes"].values() if attr in studentAttrDict}
+    return json.dumps([sourceConfigObj, attrFilters], sort_keys=True)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('filename', metavar='CONFIG_FILE', type=str,
         help='The .json file describing your class.')
+    parser.add_argument('-o', '--output-dir', default=str(DEFAULT_REPORTS_DIR), metavar='DIR', help='Directory to write the reports to (default: reports)')
     parser.add_argument('-p', '--pdf', action='store_true', help='Generate pdf reports')
     parser.add_argument('-w', '--wkhtmltopdf-path', help='Path to wkhtmltopdf executable')
+    parser.add_argument('--pdf-backend', choices=['wkhtmltopdf', 'native'], default='wkhtmltopdf',
+        help='Convert the html reports with wkhtmltopdf (default), or draw the pdfs directly without it (native)')
+    parser.add_argument('--pdf-jobs', type=int, help='Number of pdfs to generate at once (default: number of cpus)')
+    parser.add_argument('--pdf-batch', type=int, metavar='N', help='Convert the reports of N students with each wkhtmltopdf process, into combined pdfs listed in pdf-index.csv')
+    parser.add_argument('--pdf-split', action='store_true', help='With --pdf-batch, split the combined pdfs into one pdf per student')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes used to read sources (default: 1)')
+    parser.add_argument('--store', metavar='DB_FILE', help='Also save the students, identifiers and grades to the SQLite file DB_FILE, updating what earlier runs saved there (see query.py)')
+    parser.add_argument('--cache-dir', help='Directory in which to cache the data read from each source, so that unchanged sources are not re-read on the next run')
+    parser.add_argument('--profile', nargs='?', const='profile.json', metavar='JSON_FILE',
+        help='Print the time, call count and peak memory of each stage (and, with --jobs 1, of each source) and save them to JSON_FILE (default: profile.json)')
+    parser.add_argument('--watch', nargs='?', type=float, const=1.0, metavar='SECONDS',
+        help='Keep running, and update the reports whenever the config or a source changes (checking every SECONDS, default 1)')
+    parser.add_argument('--cprofile', metavar='PROF_FILE',
+        help='With --profile, also run each stage under cProfile and dump the stats of the slowest one to PROF_FILE (e.g. for snakeviz or pstats)')
     args = parser.parse_args()
-    globalConfigObj = loadConfig(args.filename)
-    (gradebook, allAssignments) = gatherData(globalConfigObj)
-    students = gradebook.items()
-    if args.pdf:
-        # Attach progress bar only if generating pdfs (which is slow). Non-pdf
-        # version is fast enough that progress bar is just unnecessary clutter
-        students = tqdm.tqdm(students)
-    printFilters = []
-    for (k,v) in globalConfigObj["studentAttributes"].items():
-        if v.get("onlyPrintIfPresent", False):
-            printFilters.append(k)
-    postprocess(globalConfigObj['processing'], students, allAssignments)
-    makeCsvSummary(list(globalConfigObj["studentAttributes"].keys()), students, allAssignments, globalConfigObj["outputs"]) #TODO drop lowest?
-    for (studentIdentifier, studentData) in students:
-        if shouldPrint(printFilters, studentData[INFO_KEY]):
-            printReport(studentIdentifier, studentData, allAssignments, globalConfigObj["outputs"], args.pdf, args.wkhtmltopdf_path)
+    for (given, option) in [(args.pdf_backend == 'native', '--pdf-backend native'), (args.pdf_batch, '--pdf-batch'), (args.pdf_split, '--pdf-split')]:
+        if given and not args.pdf:
+            parser.error(f"{option} only applies with --pdf")
+    if args.pdf_split and not args.pdf_batch:
+        parser.error("--pdf-split only applies with --pdf-batch")
+    if args.pdf_backend == 'native' and args.pdf_batch:
+        parser.error("--pdf-batch only applies to the wkhtmltopdf backend")
+    if args.cprofile and not args.profile:
+        parser.error("--cprofile only applies with --profile")
+    if args.watch != None and (args.profile or args.cache_dir):
+        parser.error("--watch keeps sources in memory, so it can not be combined with --profile or --cache-dir")
+    if args.watch != None and args.store:
+        parser.error("--store is not updated by --watch")
+    if args.watch != None:
+        Watcher(args.filename, args, Path(args.output_dir)).run(args.watch)
+        raise SystemExit()
+    if args.profile:
+        profiling.enable(args.cprofile != None)
+    with profiling.stage('loadConfig'):
+        globalConfigObj = loadConfig(args.filename)
+    cache = SourceCache(args.cache_dir) if args.cache_dir else None
+    with profiling.stage('gatherData'):
+        (gradebook, allAssignments) = gatherData(globalConfigObj, args.jobs, cache)
+    pdfFailures = generateReports(globalConfigObj, gradebook, args, reportsDir=Path(args.output_dir)).finish()
+    if args.store:
+        from lib.gradeStore import GradeStore
+        with profiling.stage('store'):
+            store = GradeStore(args.store)
+            store.save(gradebook, globalConfigObj["studentAttributes"], args.filename)
+            store.close()
+    profiling.report(args.profile, args.cprofile)
+    if len(pdfFailures) > 0:
+        # Let scripts (e.g. cron jobs) notice that some pdfs are missing
+        exit(1)
     # logger.info("reports generated in folder 'reports/'")
@@ -0,0 +1,37 @@
+import argparse, json, sys
+
+from lib.gradeStore import GradeStore
+
+def printGrades(store, attr, value):
+    studentID = store.findStudent(attr, value)
+    if studentID == None:
+        print(f"No student has {attr} {value}", file=sys.stderr)
+        exit(1)
+    print(studentID)
+    for (name, (score, annotations, dropped)) in store.studentGrades(studentID).items():
+        line = f"  {name}: {score}"
+        if len(annotations) > 0:
+            line += f" {json.dumps(annotations)}"
+        if dropped:
+            line += " (dropped)"
+        print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Look up students and grades saved by main.py --store.')
+    parser.add_argument('store', metavar='DB_FILE', help='The SQLite file given to main.py --store')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--student', metavar='ATTR=VALUE',
+        help='Print the grades of the student with this identifier (e.g. "Clicker ID=11111111")')
+    group.add_argument('--missing', metavar='ASSIGNMENT',
+        help='Print the students of the latest run who have no grade for the assignment')
+    args = parser.parse_args()
+    store = GradeStore(args.store)
+    if args.student != None:
+        (attr, sep, value) = args.student.partition('=')
+        if sep == '':
+            parser.error("--student takes ATTR=VALUE")
+        printGrades(store, attr, value)
+    else:
+        for studentID in store.missing(args.missing):
+            print(studentID)
+    store.close()
@@ -0,0 +1,26 @@
+import shutil, tempfile
+from pathlib import Path
+import autoconf
+from lib.config import loadConfig
+
+def test_answer():
+    with tempfile.TemporaryDirectory() as tmp:
+        data = Path(tmp) / 'data'
+        shutil.copytree('examples/data', data)
+        autoconf.main([str(data)], None, str(Path(tmp) / 'old.json'))
+
+        # Gradescope adds an assignment
+        gradesPath = data / 'CSE777_Fall_2018_grades.csv'
+        lines = gradesPath.read_text().splitlines()
+        lines = [lines[0] + ',HW 3,HW 3 - Max Points'] + [line + ',5,10' for line in lines[1:]]
+        gradesPath.write_text('\n'.join(lines) + '\n')
+        autoconf.main([str(data)], str(Path(tmp) / 'old.json'), str(Path(tmp) / 'new.json'))
+
+        # The fingerprints are kept out of the config
+        assert '_autoconf_fingerprints' not in (Path(tmp) / 'new.json').read_text()
+        assert (Path(tmp) / 'new.autoconf.json').exists()
+        old = loadConfig(Path(tmp) / 'old.json')
+        new = loadConfig(Path(tmp) / 'new.json')
+    names = lambda config: [[item['name'] for item in source['assignments']] for source in config['sources']]
+    assert [n for n in names(new) if n not in names(old)] == [['HW 1', 'HW 2', 'HW 3']]
+    assert len(names(new)) == len(names(old))
@@ -0,0 +1,12 @@
+import tempfile
+from pathlib import Path
+import autoconf
+
+def test_answer():
+    with tempfile.TemporaryDirectory() as tmp:
+        configs = []
+        for jobs in [1, 2]:
+            configPath = Path(tmp) / f'config{jobs}.json'
+            autoconf.main(['examples/data'], None, str(configPath), jobs)
+            configs.append(configPath.read_text())
+    assert configs[0] == configs[1]
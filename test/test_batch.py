@@ -0,0 +1,13 @@
+import subprocess, shutil, tempfile
+from pathlib import Path
+
+def test_answer():
+    with tempfile.TemporaryDirectory() as tmp:
+        configs = []
+        for name in ['a', 'b']:
+            configs.append(str(Path(tmp) / f'{name}.json'))
+            shutil.copy('examples/config.json', configs[-1])
+        res = subprocess.run(['python3', 'batch.py'] + configs + ['--output-root', str(Path(tmp) / 'out'), '--jobs', '2'], capture_output=True)
+        assert res.stdout.decode("utf-8") == 2 * Path('test/exampleOutput.txt').read_text()
+        for name in ['a', 'b']:
+            assert (Path(tmp) / 'out' / name / 'A12345678.html').read_text() == Path('test/exampleHtml.html').read_text()
@@ -0,0 +1,13 @@
+import main
+from lib.config import loadConfig
+from bench.generate import generateCourse
+
+def test_answer(tmp_path):
+    configPath = generateCourse(tmp_path, students=20, sources=8, assignments=30)
+    globalConfigObj = loadConfig(configPath)
+    (gradebook, allAssignments) = main.gatherData(globalConfigObj)
+    assert len(allAssignments) == 30
+    assert len(gradebook) == 20
+    for row in range(len(gradebook)):
+        assert "Roster Name" in gradebook.info[row]
+        assert gradebook.present[row].any()
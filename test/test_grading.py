@@ -0,0 +1,45 @@
+import pytest
+from lib.gradebook import Gradebook
+from lib.grading import computeTotals
+
+def test_answer():
+    allAssignments = {
+        "HW1": {"max_points": 10, "type": "homework"},
+        "HW2": {"max_points": 30, "type": "homework"},
+        "Final": {"max_points": 100, "type": "exam"}
+    }
+    gradebook = Gradebook(allAssignments)
+    for (studentID, studentScores) in [("A1", [10, 15, 80]), ("A2", [5, 30, None])]:
+        row = gradebook.addStudent(studentID)
+        for (col, score) in enumerate(studentScores):
+            if score != None:
+                gradebook.setGrade(row, col, float(score), {})
+    gradebook.compact()
+    gradingConfigObj = {
+        "categories": [
+            {"type": "homework", "weight": 50},
+            {"type": "homework", "weight": 0, "mode": "points", "title": "Homework points"},
+            {"type": "exam", "weight": 50},
+            {"type": "quiz", "weight": 10}
+        ],
+        "letterGrades": {"A": 90, "B": 80, "F": 0}
+    }
+    totals = computeTotals(gradingConfigObj, gradebook)
+    assert totals.categoryPercents[:, :3].tolist() == [[75, 62.5, 80], [75, 87.5, 0]]
+    assert totals.total.tolist() == [77.5, 37.5]
+    assert totals.letters == ["F", "F"]
+    gradebook.dropped[0, 1] = True
+    totals = computeTotals(gradingConfigObj, gradebook)
+    assert totals.total[0] == 90 and totals.letters[0] == "A"
+    assert totals.rowLines(0)[-2:] == [("quiz", "n/a (weight 10)"), ("Total", "90% (A)")]
+    # Excused (non-numeric) grades are left out like dropped ones
+    gradebook.setGrade(1, 2, "EX", {})
+    totals = computeTotals(gradingConfigObj, gradebook)
+    assert totals.rowLines(1)[2] == ("exam", "n/a (weight 50)")
+    assert totals.total[1] == 75
+    # Graded categories need max_points
+    gradebook = Gradebook({"Participation": {"type": "participation"}})
+    gradebook.setGrade(gradebook.addStudent("A1"), 0, 1.0, {})
+    gradebook.compact()
+    with pytest.raises(Exception, match="Participation"):
+        computeTotals({"categories": [{"type": "participation", "weight": 10}]}, gradebook)
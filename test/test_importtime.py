@@ -0,0 +1,22 @@
+import subprocess, sys
+
+# Seconds that importing each entry point may take (it is about 0.15s for
+# main.py, mostly numpy, and 0.05s for autoconf.py), with room for slow machines
+COLD_START_BUDGET = 1.0
+# Only imported by the runs that need them
+LAZY_MODULES = ['pdfkit', 'tqdm', 'openpyxl', 'pyexcel', 'dateutil', 'pypdf']
+
+def importTime(module):
+    '''Returns the seconds taken to import `module` in a fresh interpreter,
+    and the lazy modules that it imported'''
+    code = f"import sys, {module}; print(' '.join(m for m in {LAZY_MODULES} if m in sys.modules))"
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, check=True)
+    lastLine = res.stderr.decode("utf-8").strip().splitlines()[-1]
+    assert lastLine.endswith(f'| {module}')
+    return (int(lastLine.split('|')[1]) / 1e6, res.stdout.decode("utf-8").split())
+
+def test_answer():
+    for module in ['main', 'autoconf']:
+        (seconds, imported) = importTime(module)
+        assert imported == []
+        assert seconds < COLD_START_BUDGET
@@ -0,0 +1,26 @@
+import main
+from lib.gradebook import Gradebook
+
+def test_answer():
+    studentAttrDict = {
+        "Student ID": {"identifiesStudent": True, "onePerStudent": True},
+        "Email": {"identifiesStudent": True, "onePerStudent": False},
+        "Clicker ID": {"identifiesStudent": True, "onePerStudent": False}
+    }
+    roster = {"Email": {}, "Clicker ID": {}}
+    gradebook = Gradebook({"HW1": {"max_points": 5, "type": "homework"}, "10/1": {"max_points": 1, "type": "clickers"}})
+    deferred = {}
+    waiting = []
+    rows = [
+        ({"Clicker ID": "C1"}, {"10/1": (1.0, {})}),
+        ({"Clicker ID": "C1", "Email": "ash@ucsd.edu"}, {}),
+        ({"Clicker ID": "C2"}, {"10/1": (1.0, {})}),
+        ({"Student ID": "A12345678", "Email": "ash@ucsd.edu"}, {"HW1": (5.0, {})})
+    ]
+    for (studentInfo, grades) in rows:
+        main.mergeOrDefer(studentAttrDict, "Student ID", roster, gradebook, deferred, waiting, studentInfo, grades)
+    # The first clicker row is resolved through the chain Clicker ID -> Email -> Student ID
+    assert roster["Clicker ID"] == {"C1": "A12345678"}
+    assert gradebook.studentIDs == ["A12345678"]
+    assert gradebook.studentGrades(0) == {"HW1": (5.0, {}), "10/1": (1.0, {})}
+    assert [row for row in waiting if row != None] == [rows[2]]
@@ -0,0 +1,14 @@
+from lib.mung import compileFilters, checkAndClean, IncorrectFormatException
+
+def test_answer():
+    filters = ['strip', 'toUpper', 'ucsdIDCheck']
+    clean = compileFilters(tuple(filters), 16)
+    assert clean(' a12345678 ') == checkAndClean(' a12345678 ', filters) == 'A12345678'
+    # Failures are not memoized, so they raise every time
+    for _ in range(2):
+        try:
+            clean('B12345678')
+            assert False
+        except IncorrectFormatException:
+            pass
+    assert compileFilters(tuple(filters), 16) is clean
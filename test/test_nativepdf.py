@@ -0,0 +1,13 @@
+import subprocess
+import pypdf
+from lib.printing import countPdfPages
+
+def test_answer(tmp_path):
+    res = subprocess.run(['python3', 'main.py', 'examples/config.json', '--pdf', '--pdf-backend', 'native', '-o', str(tmp_path)], capture_output=True)
+    assert res.returncode == 0
+    pdfPath = tmp_path / 'A12345678.pdf'
+    assert pdfPath.read_bytes().startswith(b'%PDF-')
+    assert countPdfPages(pdfPath) == 1
+    text = pypdf.PdfReader(str(pdfPath)).pages[0].extract_text()
+    for line in ['PID: A12345678', 'HW-1:  32/32', 'HW-2:  17/17', 'Week2:  3/3', 'Pre-class Survey:  1/1']:
+        assert line in text
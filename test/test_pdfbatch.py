@@ -0,0 +1,16 @@
+from lib.printing import readReportStarts
+
+def test_answer():
+    outlineXml = '''<?xml version="1.0" encoding="UTF-8"?>
+<outline xmlns="http://wkhtmltopdf.org/outline">
+  <item title="" page="0" link="" backLink="">
+    <item title="CSE777 Preliminary Grade Report" page="1" link="__WKANCHOR_0" backLink="__WKANCHOR_1">
+      <item title="PID: A12345678" page="1" link="__WKANCHOR_2" backLink="__WKANCHOR_3"/>
+      <item title="Homework" page="1" link="__WKANCHOR_4" backLink="__WKANCHOR_5"/>
+    </item>
+    <item title="CSE777 Preliminary Grade Report" page="3" link="__WKANCHOR_6" backLink="__WKANCHOR_7">
+      <item title="PID: A87654321" page="3" link="__WKANCHOR_8" backLink="__WKANCHOR_9"/>
+    </item>
+  </item>
+</outline>'''
+    assert readReportStarts(outlineXml) == [1, 3]
@@ -0,0 +1,37 @@
+import csv
+from pathlib import Path
+import pdfkit, pypdf
+from lib.printing import BatchPdfRenderer
+
+# Report pages of each student, as wkhtmltopdf would lay them out
+PAGES = {'A1': 2, 'A2': 1, 'A3': 3}
+
+def fakeFromFile(htmlPaths, pdfPath, configuration=None, options={}):
+    '''Writes what wkhtmltopdf would for the reports: one combined pdf and an
+    outline with a "PID: ..." heading where each report starts'''
+    writer = pypdf.PdfWriter()
+    items = []
+    for htmlPath in htmlPaths:
+        studentIdentifier = Path(htmlPath).stem
+        items.append(f'<item title="PID: {studentIdentifier}" page="{len(writer.pages) + 1}"/>')
+        for _ in range(PAGES[studentIdentifier]):
+            writer.add_blank_page(612, 792)
+    with open(pdfPath, 'wb') as f:
+        writer.write(f)
+    Path(options['dump-outline']).write_text(f'<outline xmlns="http://wkhtmltopdf.org/outline"><item title="" page="0">{"".join(items)}</item></outline>')
+
+def test_answer(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdfkit, 'from_file', fakeFromFile)
+    for split in [False, True]:
+        reportsDir = tmp_path / str(split)
+        reportsDir.mkdir()
+        # Any existing executable passes pdfkit's check
+        renderer = BatchPdfRenderer('/bin/sh', 2, split=split, reportsDir=reportsDir)
+        for studentIdentifier in PAGES:
+            renderer.submit(studentIdentifier)
+        assert renderer.finish() == []
+        if split:
+            assert {p.stem: len(pypdf.PdfReader(str(p)).pages) for p in reportsDir.glob('*.pdf')} == PAGES
+        else:
+            with open(reportsDir / 'pdf-index.csv') as f:
+                assert list(csv.reader(f))[1:] == [['A1', 'batch-001.pdf', '1', '2'], ['A2', 'batch-001.pdf', '3', '3'], ['A3', 'batch-002.pdf', '1', '3']]
@@ -0,0 +1,8 @@
+import subprocess, tempfile
+
+def test_answer():
+    with tempfile.TemporaryDirectory() as tmp:
+        # /bin/false passes for wkhtmltopdf but fails every conversion
+        res = subprocess.run(['python3', 'main.py', 'examples/config.json', '--pdf', '-w', '/bin/false', '-o', tmp], capture_output=True)
+    assert res.returncode == 1
+    assert 'Error while generating pdf for A12345678' in res.stdout.decode("utf-8")
@@ -0,0 +1,17 @@
+import main
+
+def test_answer():
+    studentAttrDict = {"Student ID": {"filters": ["strip"]}}
+    sourceConfigObj = {
+        "file": "grades.csv",
+        "attributes": {"SID": "Student ID"},
+        "assignments": [
+            {"name": "HW1", "scoreCol": "HW 1", "max_points": 10},
+            {"name": "HW2", "scoreCol": "HW 2", "max_points": 10},
+            {"name": "Survey", "max_points": 1}
+        ]
+    }
+    (identPlan, assignmentPlan) = main.planSource(sourceConfigObj, studentAttrDict, ['SID', 'HW 2'])
+    assert identPlan == [(0, "Student ID", ["strip"])]
+    # 'HW 1' is not in the header, so HW1 is dropped from the plan
+    assert [(a['name'], scoreIdx) for (a, scoreIdx, _, _) in assignmentPlan] == [("HW2", 1), ("Survey", None)]
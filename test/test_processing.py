@@ -0,0 +1,41 @@
+import pytest
+from lib.gradebook import Gradebook
+from lib.processing import postprocess
+
+def test_answer():
+    allAssignments = {f"HW{i}": {"max_points": 10, "type": "homework"} for i in range(4)}
+    gradebook = Gradebook(allAssignments)
+    scores = [[5, 10, 5, 12], [8, 7, None, 9]]
+    for (studentID, studentScores) in zip(["A1", "A2"], scores):
+        row = gradebook.addStudent(studentID)
+        for (col, score) in enumerate(studentScores):
+            if score != None:
+                gradebook.setGrade(row, col, float(score), {})
+    gradebook.compact()
+    postprocess([
+        {"action": "cap", "type": "homework"},
+        {"action": "dropHighest", "type": "homework"},
+        {"action": "dropLowest", "type": "homework"}
+    ], gradebook)
+    assert gradebook.scores[0].tolist() == [5, 10, 5, 10]
+    # Ties go to the earlier assignment, and missing grades count as 0
+    assert gradebook.dropped.tolist() == [[True, True, False, False], [False, False, True, True]]
+    postprocess([{"action": "keepBest", "type": "homework", "keepCount": 1}], gradebook)
+    assert gradebook.dropped.sum(axis=1).tolist() == [3, 3]
+
+    # Non-numeric scores (e.g. excused) are never dropped
+    gradebook = Gradebook(allAssignments)
+    row = gradebook.addStudent("A1")
+    for (col, score) in enumerate(["EX", 7.0, 9.0, 8.0]):
+        gradebook.setGrade(row, col, score, {})
+    gradebook.compact()
+    postprocess([{"action": "dropLowest", "type": "homework", "dropCount": 4}], gradebook)
+    assert gradebook.dropped.tolist() == [[False, True, True, True]]
+    # Assignments without max_points can not be capped or compared
+    gradebook = Gradebook({"Participation": {"type": "participation"}})
+    gradebook.setGrade(gradebook.addStudent("A1"), 0, 1.0, {})
+    gradebook.compact()
+    for action in ["cap", "dropLowest"]:
+        with pytest.raises(Exception, match="Participation"):
+            postprocess([{"action": action, "type": "participation"}], gradebook)
+    assert gradebook.scores.tolist() == [[1.0]]
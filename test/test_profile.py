@@ -0,0 +1,10 @@
+import json, subprocess
+from pathlib import Path
+
+def test_answer(tmp_path):
+    profilePath = tmp_path / 'profile.json'
+    res = subprocess.run(['python3', 'main.py', 'examples/config.json', '--profile', str(profilePath)], capture_output=True)
+    assert res.stdout.decode("utf-8") == Path('test/exampleOutput.txt').read_text()
+    stages = {stat['stage']: stat for stat in json.loads(profilePath.read_text())}
+    assert stages['gatherData']['calls'] == 1
+    assert stages['source examples/data/ReviewQuizzes.xlsx [Week1]']['seconds'] <= stages['gatherData']['seconds']
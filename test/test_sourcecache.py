@@ -0,0 +1,38 @@
+import json, os, shutil, subprocess
+from pathlib import Path
+from lib.config import loadConfig
+from lib.sourceCache import SourceCache
+
+def test_answer(tmp_path):
+    shutil.copytree('examples/data', tmp_path / 'data')
+    config = json.loads(Path('examples/config.json').read_text())
+    for source in config['sources']:
+        source['file'] = str(tmp_path / 'data' / Path(source['file']).name)
+    configPath = tmp_path / 'config.json'
+    configPath.write_text(json.dumps(config))
+    expected = Path('test/exampleOutput.txt').read_text()
+    run = lambda *extra: subprocess.run(['python3', 'main.py', str(configPath), '--cache-dir', str(tmp_path / 'cache'), '-o', str(tmp_path / 'reports')] + list(extra), capture_output=True)
+
+    # The second and third runs load every source from the cache
+    for extra in [[], [], ['-j', '2']]:
+        res = run(*extra)
+        assert res.returncode == 0
+        assert res.stdout.decode("utf-8") == expected
+    assert len(list((tmp_path / 'cache').glob('*.pickle'))) == len(loadConfig(configPath)['sources'])
+
+    # An edited source is read again
+    gradesPath = tmp_path / 'data' / 'CSE777_Fall_2018_grades.csv'
+    gradesPath.write_text(gradesPath.read_text().replace('A12345678,ash@ucsd.edu,,32,32', 'A12345678,ash@ucsd.edu,,30,32'))
+    res = run()
+    assert res.stdout.decode("utf-8") == expected.replace('\tHW-1\t32/32', '\tHW-1\t30/32', 1)
+
+    # Only the most recently used entries that fit in maxBytes are kept
+    cache = SourceCache(tmp_path / 'small', maxBytes=2500)
+    for (i, key) in enumerate(['a', 'b', 'c']):
+        cache.store(key, key * 1000)
+        os.utime(cache.entryPath(key), (i, i))
+    assert cache.load('a') == 'a' * 1000
+    cache.finish()
+    assert cache.load('b') == None
+    assert cache.load('a') == 'a' * 1000
+    assert cache.load('c') == 'c' * 1000
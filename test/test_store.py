@@ -0,0 +1,56 @@
+import subprocess, tempfile
+from pathlib import Path
+from lib.gradeStore import GradeStore
+
+def test_answer():
+    with tempfile.TemporaryDirectory() as tmp:
+        dbPath = Path(tmp) / 'grades.db'
+        for _ in range(2):
+            res = subprocess.run(['python3', 'main.py', 'examples/config.json', '--store', str(dbPath), '-o', tmp], capture_output=True)
+            assert res.stdout.decode("utf-8") == Path('test/exampleOutput.txt').read_text()
+        store = GradeStore(dbPath)
+        assert store.findStudent('Clicker ID', '1B1B1B1B') == 'A12345678'
+        assert store.studentGrades('A12345678')['HW-1'] == (32.0, {}, True)
+        assert store.missing('HW-2') == ['A77777777']
+        # Nothing changed since the last run
+        assert store.connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0] == 2
+        assert store.save(*savedGradebook()) == 0
+        store.close()
+    checkDeparted()
+
+def savedGradebook():
+    import argparse, contextlib, io
+    import main
+    from lib.config import loadConfig
+    globalConfigObj = loadConfig('examples/config.json')
+    (gradebook, _) = main.gatherData(globalConfigObj)
+    with tempfile.TemporaryDirectory() as reportsDir, contextlib.redirect_stdout(io.StringIO()):
+        main.generateReports(globalConfigObj, gradebook, argparse.Namespace(pdf=False), reportsDir=Path(reportsDir)).finish()
+    return (gradebook, globalConfigObj["studentAttributes"])
+
+def checkDeparted():
+    '''Students who leave the sources can no longer be found by ID'''
+    from lib.gradebook import Gradebook
+    studentAttrDict = {
+        "Student ID": {"identifiesStudent": True, "onePerStudent": True},
+        "Clicker ID": {"identifiesStudent": True, "onePerStudent": False}
+    }
+    def gradebookOf(students):
+        gradebook = Gradebook({"HW1": {"max_points": 10, "type": "homework"}})
+        for (studentID, clickerID) in students:
+            row = gradebook.addStudent(studentID)
+            gradebook.info[row]["Clicker ID"] = {clickerID}
+            gradebook.setGrade(row, 0, 5.0, {})
+        gradebook.compact()
+        return gradebook
+    with tempfile.TemporaryDirectory() as tmp:
+        store = GradeStore(Path(tmp) / 'grades.db')
+        store.save(gradebookOf([("A1", "C1"), ("A2", "C2")]), studentAttrDict)
+        # A1 leaves, and their clicker is not reused yet
+        store.save(gradebookOf([("A2", "C2")]), studentAttrDict)
+        assert store.findStudent("Clicker ID", "C1") == None
+        assert store.studentGrades("A1") == {"HW1": (5.0, {}, False)}
+        # A1 comes back unchanged
+        store.save(gradebookOf([("A1", "C1"), ("A2", "C2")]), studentAttrDict)
+        assert store.findStudent("Clicker ID", "C1") == "A1"
+        store.close()
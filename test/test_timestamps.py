@@ -0,0 +1,12 @@
+from lib.timestamps import parseTimestamp, TimestampColumn
+
+def test_answer():
+    columns = [
+        ['10/2/2018 9:15:00', '10/3/2018 23:59:59', '10/4/2018 0:00:01', '9/30/2018 12:00:00', '10/1/2018 8:30:15', '13/10/2018 10:00:00', '10/5/2018 1:02:03'],
+        ['2018-10-02 09:15:00', '2018-10-03 23:59:59', '2018-10-04 00:00:01', '2018-09-30 12:00:00', '2018-10-01 08:30:15', 'Oct 5 2018 1:02:03 PM'],
+        ['43375.38541666667', '43376.99998842592', '43377', '43373.5', '43374.35434027778', '20181005', '43378.04309027778']
+    ]
+    for values in columns:
+        timestampColumn = TimestampColumn()
+        assert [timestampColumn.parse(v) for v in values] == [parseTimestamp(v) for v in values]
+        assert timestampColumn.fastParse != None
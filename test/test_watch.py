@@ -0,0 +1,44 @@
+import argparse, contextlib, io, json, logging, shutil
+from pathlib import Path
+import main
+
+def test_answer(tmp_path, caplog):
+    shutil.copytree('examples/data', tmp_path / 'data')
+    config = json.loads(Path('examples/config.json').read_text())
+    for source in config['sources']:
+        source['file'] = str(tmp_path / 'data' / Path(source['file']).name)
+    configPath = tmp_path / 'config.json'
+    configPath.write_text(json.dumps(config))
+    reportsDir = tmp_path / 'reports'
+    reportsDir.mkdir()
+    watcher = main.Watcher(configPath, argparse.Namespace(pdf=False), reportsDir)
+
+    def update():
+        caplog.clear()
+        stdout = io.StringIO()
+        with caplog.at_level(logging.INFO, logger='main'), contextlib.redirect_stdout(stdout):
+            watcher.update()
+        reads = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Reading ')]
+        return (stdout.getvalue(), reads)
+
+    expected = Path('test/exampleOutput.txt').read_text()
+    (output, reads) = update()
+    assert output == expected
+    assert len(reads) == len(watcher.globalConfigObj["sources"])
+    htmls = {p.name: (p.stat().st_mtime_ns, p.read_text()) for p in reportsDir.glob('*.html')}
+
+    # Nothing changed, so nothing is read and no report is rewritten
+    assert update() == ('', [])
+
+    # Only the changed source is read again, and only its student's report rewritten
+    gradesPath = tmp_path / 'data' / 'CSE777_Fall_2018_grades.csv'
+    gradesPath.write_text(gradesPath.read_text().replace('A12345678,ash@ucsd.edu,,32,32', 'A12345678,ash@ucsd.edu,,30,32'))
+    (output, reads) = update()
+    assert reads == [f'Reading {gradesPath}']
+    ashReport = [block for block in expected.split('\n\n') if 'A12345678' in block]
+    assert output.strip() == ashReport[0].replace('\tHW-1\t32/32', '\tHW-1\t30/32').strip()
+    for p in reportsDir.glob('*.html'):
+        if p.name == 'A12345678.html':
+            assert '30/32' in p.read_text() and p.read_text() != htmls[p.name][1]
+        else:
+            assert (p.stat().st_mtime_ns, p.read_text()) == htmls[p.name]